@@ -1,21 +1,196 @@
 import secrets
 import hashlib
+import json
+import re
 import sqlite3
+import queue
+import threading
+import time
+import atexit
+import logging
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify
+from flask import current_app, request, jsonify
 import os
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Applied to every pooled connection: WAL lets validations read while usage
+# logging writes, and NORMAL sync avoids an fsync on every commit
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Accepts a bare key or "Bearer <key>"; keys are "tsx_" + token_urlsafe(32)
+_KEY_RE = re.compile(r'(?:Bearer\s+)?(tsx_[A-Za-z0-9_-]{43})')
+
+# Bodies of the 401s sent before the key store is touched, serialized once
+_MISSING_API_KEY_BODY = json.dumps({
+    "success": False,
+    "error": "API key required",
+    "code": "MISSING_API_KEY",
+    "help": "Include your API key in the X-API-Key header"
+}, separators=(",", ":")).encode()
+_INVALID_KEY_FORMAT_BODY = json.dumps({
+    "success": False,
+    "error": "Invalid API key format",
+    "code": "INVALID_API_KEY"
+}, separators=(",", ":")).encode()
+
+# Usage is aggregated per (key, endpoint, second) and the background thread
+# writes finished seconds every USAGE_WRITE_INTERVAL seconds
+USAGE_WRITE_INTERVAL = 0.5
+
+# With REDIS_URL set, every worker process counts cached requests against one
+# shared per-day counter, so daily limits hold between write-backs
+REDIS_URL = os.environ.get("REDIS_URL", "")
+
+# Without Redis, a worker serves a limited key's cache hits only from requests
+# it reserved ("leased") in the database, up to this many at a time and never
+# more than an eighth of what is left, so the daily limit holds across workers
+API_KEY_LEASE_SIZE = int(os.environ.get("API_KEY_LEASE_SIZE", "32"))
+
+def _local_day_start(ts):
+    """Unix timestamp of local midnight on the day containing ts"""
+    t = time.localtime(ts)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1))
+
+def _shared_count_key(key_lookup, day_start):
+    """Redis key of a key's request count for the day starting at day_start"""
+    return f"apikey:count:{key_lookup}:{int(day_start)}"
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled database connection frees up in time"""
+
+
 class APIKeyManager:
-    def __init__(self, db_path="api_keys.db"):
+    def __init__(self, db_path="api_keys.db", pool_size=8, pool_timeout=5.0,
+                 cache_size=10_000, cache_ttl=60.0, flush_interval=5.0, redis_url=REDIS_URL):
         self.db_path = db_path
+        self.pool_timeout = pool_timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+
+        # Keys are random 256-bit tokens, so a fast keyed BLAKE2b digest is as
+        # good as SHA-256 for lookups. Rotating the secret is safe: rows are
+        # re-keyed from the legacy sha256 key_hash on their next validation
+        secret = os.environ.get("API_KEY_LOOKUP_SECRET", "")
+        self._server_key = hashlib.blake2b(secret.encode()).digest() if secret else b""
+
+        # Keep long-lived connections open instead of reconnecting per call
+        self._pool = queue.Queue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+        # Validated keys: lookup hash -> (entry, deadline). Requests served from
+        # the cache are counted in _pending_counts and written back in batches;
+        # without Redis, limited keys are served from a lease instead (see
+        # _lease_requests) and _pending_counts gives back what goes unused
+        self._cache = OrderedDict()
+        self._pending_counts = Counter()
+        self._cache_lock = threading.Lock()
+
+        # Usage waiting for the writer thread:
+        # (key_id, endpoint, second) -> [hits, ip_address, user_agent]
+        self._usage_buckets = {}
+        self._usage_lock = threading.Lock()
+
+        self.shared_counts = None
+        if redis_url:
+            if redis is None:
+                logger.warning("REDIS_URL is set but the redis package is not installed; shared request counts disabled")
+            else:
+                self.shared_counts = redis.Redis.from_url(redis_url)
+
         self.init_database()
+        # Counters left over from a previous day (e.g. the app was down at midnight)
+        self.reset_daily_counts(before=_local_day_start(time.time()))
+
+        self._start_writer()
+        atexit.register(self.close)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start_writer(self):
+        self._writer_thread = threading.Thread(
+            target=self._writer_loop, name="api-key-writer", daemon=True
+        )
+        self._writer_thread.start()
+
+    def _after_fork(self):
+        """
+        Give a forked child (e.g. a gunicorn worker) its own connections,
+        locks and writer thread; none of the parent's survive the fork
+        """
+        # SQLite connections must not cross a fork. Keep the inherited ones
+        # referenced but unused: closing them here could checkpoint the
+        # parent's WAL from this process. The old queue is kept whole, not
+        # drained: its lock may have been held by a parent thread at fork
+        self._inherited_pool = self._pool
+        self._pool = queue.Queue(maxsize=self._inherited_pool.maxsize)
+        for _ in range(self._pool.maxsize):
+            self._pool.put(self._connect())
+
+        # Pending counts and usage belong to the parent, which writes them
+        self._cache = OrderedDict()
+        self._pending_counts = Counter()
+        self._cache_lock = threading.Lock()
+        self._usage_buckets = {}
+        self._usage_lock = threading.Lock()
+        self._start_writer()
+
+    def _connect(self):
+        """Open a connection that can be shared across request threads"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def get_conn(self):
+        """Borrow a pooled connection and hand it back when done"""
+        try:
+            conn = self._pool.get(timeout=self.pool_timeout)
+        except queue.Empty:
+            raise PoolExhaustedError(
+                f"No database connection available after {self.pool_timeout}s"
+            ) from None
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a pooled connection and run the block in one transaction"""
+        with self.get_conn() as conn:
+            conn.execute("BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
     
     def init_database(self):
         """Initialize the API keys database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        with self.get_conn() as conn:
+            self._create_tables(conn.cursor())
+
+    def _create_tables(self, cursor):
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS api_keys (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,15 +218,40 @@ class APIKeyManager:
                 user_agent TEXT
             )
         ''')
-        
-        conn.commit()
-        conn.close()
+
+        # Databases created before these columns existed get them added here
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(api_keys)')}
+        if 'key_lookup' not in columns:
+            cursor.execute('ALTER TABLE api_keys ADD COLUMN key_lookup TEXT')
+        for column in ('expires_at_epoch', 'created_at_epoch'):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE api_keys ADD COLUMN {column} INTEGER')
+
+        # Unix timestamps let validation compare ints instead of parsing dates.
+        # expires_at was written as local time, created_at by CURRENT_TIMESTAMP (UTC)
+        cursor.execute('''
+            UPDATE api_keys SET expires_at_epoch = CAST(strftime('%s', expires_at, 'utc') AS INTEGER)
+            WHERE expires_at_epoch IS NULL AND expires_at IS NOT NULL
+        ''')
+        cursor.execute('''
+            UPDATE api_keys SET created_at_epoch = CAST(strftime('%s', created_at) AS INTEGER)
+            WHERE created_at_epoch IS NULL AND created_at IS NOT NULL
+        ''')
+        usage_columns = {row[1] for row in cursor.execute('PRAGMA table_info(api_usage)')}
+        if 'hits' not in usage_columns:
+            cursor.execute('ALTER TABLE api_usage ADD COLUMN hits INTEGER DEFAULT 1')
+
+        # key_hash is not UNIQUE, so without an index every lookup is a full scan
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_api_keys_hash ON api_keys(key_hash)')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_api_keys_lookup ON api_keys(key_lookup)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_api_usage_key_id ON api_usage(key_id, timestamp)')
     
     def generate_api_key(self, user_email, user_name, plan_type="free"):
         """Generate a new API key"""
         # Generate a secure random API key
         api_key = f"tsx_{secrets.token_urlsafe(32)}"
         key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        key_lookup = self._lookup_hash(api_key)
         
         # Set limits based on plan
         limits = {
@@ -64,141 +264,434 @@ class APIKeyManager:
         request_limit = limits.get(plan_type, 100)
         expires_at = datetime.now() + timedelta(days=365)  # 1 year expiry
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT INTO api_keys 
-                (key_id, key_hash, user_email, user_name, plan_type, request_limit, expires_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (api_key[:12], key_hash, user_email, user_name, plan_type, request_limit, expires_at))
-            
-            conn.commit()
-            return {
-                "api_key": api_key,
-                "plan": plan_type,
-                "daily_limit": request_limit,
-                "expires_at": expires_at.isoformat()
-            }
-        except sqlite3.IntegrityError:
-            return None
-        finally:
-            conn.close()
+        with self.get_conn() as conn:
+            try:
+                conn.execute('''
+                    INSERT INTO api_keys 
+                    (key_id, key_hash, key_lookup, user_email, user_name, plan_type, request_limit,
+                     expires_at, expires_at_epoch, created_at_epoch)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (api_key[:12], key_hash, key_lookup, user_email, user_name, plan_type, request_limit,
+                      expires_at, int(expires_at.timestamp()), int(time.time())))
+            except sqlite3.IntegrityError:
+                return None
+
+        return {
+            "api_key": api_key,
+            "plan": plan_type,
+            "daily_limit": request_limit,
+            "expires_at": expires_at.isoformat()
+        }
     
     def validate_api_key(self, api_key):
         """Validate API key and check limits"""
-        if not api_key or not api_key.startswith("tsx_"):
+        if not api_key:
             return {"valid": False, "error": "Invalid API key format"}
         
-        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        key_lookup = self._lookup_hash(api_key)
+        cached = self._validate_cached(key_lookup)
+        if cached is not None:
+            return cached
+
+        now = time.time()
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            claimed = self._claim_request(cursor, key_lookup, now)
+
+            if claimed is None:
+                # Rare path: find out why, re-keying legacy rows on the way
+                error = self._rejection_reason(cursor, api_key, key_lookup, now)
+                if error:
+                    return {"valid": False, "error": error}
+                claimed = self._claim_request(cursor, key_lookup, now)
+                if claimed is None:
+                    return {"valid": False, "error": "Daily API limit exceeded"}
+
+            email, plan, requests_made, limit, expires_at_epoch = claimed
+            lease = None
+            if self.shared_counts is None and limit > 0:
+                lease = self._lease_requests(cursor, key_lookup, requests_made, limit)
+
+        # Another worker may have counted requests the database hasn't seen yet
+        shared = self._shared_count(key_lookup, seed=requests_made)
+        if shared is not None:
+            requests_made = max(requests_made, shared)
+
+        entry = {
+            "key_lookup": key_lookup,
+            "user_email": email,
+            "plan": plan,
+            "request_limit": limit,
+            "requests_made": requests_made,
+            # Leased request numbers left to serve from the cache, first to last
+            "lease": lease,
+        }
+        self._cache_put(key_lookup, entry, expires_at_epoch)
+        if limit > 0 and requests_made > limit:
+            # Only the shared counter can push it past; the cached entry
+            # now turns the key away without another lookup
+            return {"valid": False, "error": "Daily API limit exceeded"}
+        return self._validation_result(entry)
+
+    def _lookup_hash(self, api_key):
+        """Keyed digest used to find a key in the database and the cache"""
+        return hashlib.blake2b(api_key.encode(), digest_size=16, key=self._server_key).hexdigest()
+
+    @staticmethod
+    def _claim_request(cursor, key_lookup, now):
+        """
+        Count one request against an active, unexpired key that is under its
+        daily limit, in a single statement. Returns None if the key does not
+        qualify; _rejection_reason says why.
+        """
         cursor.execute('''
-            SELECT key_id, user_email, plan_type, requests_made, request_limit, 
-                   expires_at, is_active, created_at
-            FROM api_keys 
-            WHERE key_hash = ?
-        ''', (key_hash,))
-        
-        result = cursor.fetchone()
-        
+            UPDATE api_keys
+            SET requests_made = requests_made + 1, last_used = CURRENT_TIMESTAMP
+            WHERE key_lookup = ?
+              AND is_active = 1
+              AND (expires_at_epoch IS NULL OR expires_at_epoch >= ?)
+              AND (request_limit <= 0 OR requests_made < request_limit)
+            RETURNING user_email, plan_type, requests_made, request_limit, expires_at_epoch
+        ''', (key_lookup, now))
+        return cursor.fetchone()
+
+    @staticmethod
+    def _lease_requests(cursor, key_lookup, requests_made, limit):
+        """
+        Reserve the next few requests of a limited key for this worker's cache
+        hits. Returns the [first, last] request numbers reserved, or None if
+        the key is too close to its limit to lease any.
+        """
+        size = min(API_KEY_LEASE_SIZE, (limit - requests_made) // 8)
+        if size <= 0:
+            return None
+        cursor.execute('''
+            UPDATE api_keys SET requests_made = requests_made + ?
+            WHERE key_lookup = ? AND requests_made + ? <= request_limit
+            RETURNING requests_made
+        ''', (size, key_lookup, size))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        # Other workers may have claimed requests since ours; the lease is
+        # the block this statement added
+        return [row[0] - size + 1, row[0]]
+
+    def _release_lease(self, entry):
+        """Give back a cached entry's unused leased requests (call under _cache_lock)"""
+        lease = entry["lease"]
+        if lease is not None and lease[0] <= lease[1]:
+            self._pending_counts[entry["key_lookup"]] -= lease[1] - lease[0] + 1
+        entry["lease"] = None
+
+    def _rejection_reason(self, cursor, api_key, key_lookup, now):
+        """Explain why _claim_request refused a key, or None if it should be retried"""
+        result = self._fetch_key(cursor, api_key, key_lookup)
         if not result:
-            conn.close()
-            return {"valid": False, "error": "API key not found"}
-        
-        key_id, email, plan, requests_made, limit, expires_at, is_active, created_at = result
-        
-        # Check if key is active
+            return "API key not found"
+
+        key_id, email, plan, requests_made, limit, expires_at_epoch, is_active = result
         if not is_active:
-            conn.close()
-            return {"valid": False, "error": "API key has been deactivated"}
-        
-        # Check expiry
-        if expires_at and datetime.fromisoformat(expires_at) < datetime.now():
-            conn.close()
-            return {"valid": False, "error": "API key has expired"}
-        
-        # Check daily rate limit (reset every 24 hours)
-        try:
-            created_date = datetime.fromisoformat(created_at).date()
-            today = datetime.now().date()
-            
-            if created_date < today:
-                # Reset daily counter
-                cursor.execute('UPDATE api_keys SET requests_made = 0 WHERE key_hash = ?', (key_hash,))
-                requests_made = 0
-        except:
-            # Fallback if date parsing fails
-            pass
-        
-        # Check if limit exceeded
+            return "API key has been deactivated"
+        if expires_at_epoch is not None and expires_at_epoch < now:
+            return "API key has expired"
         if limit > 0 and requests_made >= limit:
-            conn.close()
-            return {"valid": False, "error": "Daily API limit exceeded"}
-        
-        # Update usage
-        cursor.execute('''
-            UPDATE api_keys 
-            SET requests_made = requests_made + 1, last_used = CURRENT_TIMESTAMP
-            WHERE key_hash = ?
-        ''', (key_hash,))
-        
-        conn.commit()
-        conn.close()
-        
+            return "Daily API limit exceeded"
+        # The row was only reachable by its legacy key_hash and is now re-keyed
+        return None
+
+    @staticmethod
+    def _fetch_key(cursor, api_key, key_lookup):
+        query = '''
+            SELECT key_id, user_email, plan_type, requests_made, request_limit, 
+                   expires_at_epoch, is_active
+            FROM api_keys 
+            WHERE {} = ?
+        '''
+        cursor.execute(query.format('key_lookup'), (key_lookup,))
+        result = cursor.fetchone()
+        if result:
+            return result
+
+        # Rows written before key_lookup existed (or under another secret)
+        # are only reachable through the sha256 key_hash; re-key them once
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        cursor.execute(query.format('key_hash'), (key_hash,))
+        result = cursor.fetchone()
+        if result:
+            cursor.execute('UPDATE api_keys SET key_lookup = ? WHERE key_hash = ?', (key_lookup, key_hash))
+        return result
+
+    @staticmethod
+    def _validation_result(entry):
+        limit = entry["request_limit"]
         return {
             "valid": True,
-            "user_email": email,
-            "plan": plan,
-            "requests_remaining": max(0, limit - requests_made - 1) if limit > 0 else "unlimited"
+            "user_email": entry["user_email"],
+            "plan": entry["plan"],
+            "requests_remaining": max(0, limit - entry["requests_made"]) if limit > 0 else "unlimited"
         }
-    
+
+    def _validate_cached(self, cache_key):
+        """Serve a validation from the cache, or return None on a miss"""
+        with self._cache_lock:
+            cached = self._cache.get(cache_key)
+            if cached is None:
+                return None
+
+            entry, deadline = cached
+            if deadline < time.time():
+                self._release_lease(entry)
+                del self._cache[cache_key]
+                return None
+
+            limit = entry["request_limit"]
+            if limit > 0 and entry["requests_made"] >= limit:
+                return {"valid": False, "error": "Daily API limit exceeded"}
+            self._cache.move_to_end(cache_key)
+
+            if self.shared_counts is None:
+                if limit > 0:
+                    # Other workers' hits aren't visible here, so only leased
+                    # requests are served; past the lease the database decides
+                    lease = entry["lease"]
+                    if lease is None or lease[0] > lease[1]:
+                        return None
+                    entry["requests_made"] = lease[0]
+                    lease[0] += 1
+                    # Counted when leased; the write-back still updates last_used
+                    self._pending_counts[entry["key_lookup"]] += 0
+                    return self._validation_result(entry)
+                entry["requests_made"] += 1
+                self._pending_counts[entry["key_lookup"]] += 1
+                return self._validation_result(entry)
+
+        # Count against the shared counter outside the lock; fall back to
+        # the local count if Redis can't be reached
+        shared = self._shared_count(entry["key_lookup"])
+        with self._cache_lock:
+            if shared is None:
+                if limit > 0 and entry["requests_made"] >= limit:
+                    return {"valid": False, "error": "Daily API limit exceeded"}
+                entry["requests_made"] += 1
+            else:
+                # Past the limit is remembered locally so later requests skip Redis
+                entry["requests_made"] = max(entry["requests_made"], shared)
+                if limit > 0 and shared > limit:
+                    return {"valid": False, "error": "Daily API limit exceeded"}
+            self._pending_counts[entry["key_lookup"]] += 1
+            return self._validation_result(entry)
+
+    def _shared_count(self, key_lookup, seed=None):
+        """
+        Count one request on the key's shared counter for today and return
+        the new total, or None without Redis. seed is the total including
+        this request as the database has it, used if no counter exists yet.
+        """
+        if self.shared_counts is None:
+            return None
+        day_start = _local_day_start(time.time())
+        name = _shared_count_key(key_lookup, day_start)
+        try:
+            with self.shared_counts.pipeline(transaction=False) as pipe:
+                if seed is not None:
+                    pipe.set(name, seed - 1, nx=True)
+                pipe.incr(name)
+                # Gone a while after midnight; tomorrow uses a new name
+                pipe.expireat(name, int(day_start) + 2 * 86400)
+                results = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Shared request count failed: {e}")
+            return None
+        return results[-2]
+
+    def _cache_put(self, cache_key, entry, key_expires_ts=None):
+        # Never serve a key from the cache past its own expiry
+        deadline = time.time() + self.cache_ttl
+        if key_expires_ts is not None:
+            deadline = min(deadline, key_expires_ts)
+
+        with self._cache_lock:
+            replaced = self._cache.get(cache_key)
+            if replaced is not None:
+                self._release_lease(replaced[0])
+            self._cache[cache_key] = (entry, deadline)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.cache_size:
+                self._release_lease(self._cache.popitem(last=False)[1][0])
+
+    def invalidate(self, api_key):
+        """Drop a key from the validation cache"""
+        with self._cache_lock:
+            cached = self._cache.pop(self._lookup_hash(api_key), None)
+            if cached is not None:
+                self._release_lease(cached[0])
+
+    def deactivate_api_key(self, api_key):
+        """Deactivate an API key and evict it from the cache"""
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        with self.get_conn() as conn:
+            conn.execute('UPDATE api_keys SET is_active = 0 WHERE key_hash = ?', (key_hash,))
+        self.invalidate(api_key)
+
+    def flush_counts(self):
+        """Write request counts accumulated from cache hits back to the database"""
+        with self._cache_lock:
+            if not self._pending_counts:
+                return
+            pending, self._pending_counts = self._pending_counts, Counter()
+
+        try:
+            with self.transaction() as conn:
+                conn.executemany('''
+                    UPDATE api_keys 
+                    SET requests_made = MAX(0, requests_made + ?), last_used = CURRENT_TIMESTAMP
+                    WHERE key_lookup = ?
+                ''', [(count, key_lookup) for key_lookup, count in pending.items()])
+        except Exception:
+            # Keep the counts so the next flush retries them
+            with self._cache_lock:
+                self._pending_counts.update(pending)
+            raise
+
+    def reset_daily_counts(self, before=None):
+        """
+        Zero the daily request counters. With before (a Unix timestamp), only
+        keys last used before then are reset.
+        """
+        # Land counts from before the reset first so they aren't added afterwards
+        self.flush_counts()
+        with self.get_conn() as conn:
+            if before is None:
+                conn.execute('UPDATE api_keys SET requests_made = 0 WHERE requests_made != 0')
+            else:
+                conn.execute('''
+                    UPDATE api_keys SET requests_made = 0
+                    WHERE requests_made != 0
+                      AND (last_used IS NULL OR CAST(strftime('%s', last_used) AS INTEGER) < ?)
+                ''', (int(before),))
+        # Cached entries carry the old counts
+        with self._cache_lock:
+            self._cache.clear()
+
     def log_usage(self, key_id, endpoint, ip_address, user_agent):
-        """Log API usage for analytics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO api_usage (key_id, endpoint, ip_address, user_agent)
-            VALUES (?, ?, ?, ?)
-        ''', (key_id, endpoint, ip_address, user_agent))
-        
-        conn.commit()
-        conn.close()
+        """
+        Record API usage for analytics. Calls for the same key and endpoint
+        within one second share a single api_usage row with a hits count.
+        """
+        bucket = (key_id, endpoint, int(time.time()))
+        with self._usage_lock:
+            usage = self._usage_buckets.get(bucket)
+            if usage is None:
+                self._usage_buckets[bucket] = [1, ip_address, user_agent]
+            else:
+                usage[0] += 1
+
+    def flush(self):
+        """Write all buffered usage and pending request counts"""
+        self._write_usage(self._take_usage())
+        self.flush_counts()
+
+    def close(self):
+        """Give back unused leased requests and write everything buffered (at exit)"""
+        with self._cache_lock:
+            for entry, _ in self._cache.values():
+                self._release_lease(entry)
+        self.flush()
+
+    def _take_usage(self, before=None):
+        """Remove and return usage buckets for seconds earlier than before (all if None)"""
+        with self._usage_lock:
+            if before is None:
+                taken, self._usage_buckets = self._usage_buckets, {}
+                return taken
+            taken = {bucket: usage for bucket, usage in self._usage_buckets.items() if bucket[2] < before}
+            for bucket in taken:
+                del self._usage_buckets[bucket]
+        return taken
+
+    def _write_usage(self, buckets):
+        if not buckets:
+            return
+        # Match the CURRENT_TIMESTAMP format the column defaulted to before
+        rows = [
+            (key_id, endpoint, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(second)), ip_address, user_agent, hits)
+            for (key_id, endpoint, second), (hits, ip_address, user_agent) in buckets.items()
+        ]
+        try:
+            with self.transaction() as conn:
+                conn.executemany('''
+                    INSERT INTO api_usage (key_id, endpoint, timestamp, ip_address, user_agent, hits)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+        except Exception:
+            # Put the hits back so the next write retries them
+            with self._usage_lock:
+                for bucket, (hits, ip_address, user_agent) in buckets.items():
+                    usage = self._usage_buckets.setdefault(bucket, [0, ip_address, user_agent])
+                    usage[0] += hits
+            raise
+
+    def _writer_loop(self):
+        next_flush = time.monotonic() + self.flush_interval
+        day_start = _local_day_start(time.time())
+        while True:
+            time.sleep(USAGE_WRITE_INTERVAL)
+            # Only finished seconds, so a burst still lands in one row
+            buckets = self._take_usage(before=int(time.time()))
+            try:
+                self._write_usage(buckets)
+            except Exception as e:
+                logger.error(f"Failed to write {len(buckets)} API usage rows: {e}")
+
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self.flush_interval
+                try:
+                    self.flush_counts()
+                except Exception as e:
+                    logger.error(f"Failed to flush API key usage counts: {e}")
+
+            # Daily limits start over at local midnight
+            today = _local_day_start(time.time())
+            if today > day_start:
+                try:
+                    self.reset_daily_counts()
+                    day_start = today
+                except Exception as e:
+                    logger.error(f"Failed to reset daily API key counts: {e}")
 
 # Initialize the API key manager
 api_manager = APIKeyManager()
 
-def require_api_key(f):
-    """Decorator to require API key authentication"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        # Get API key from header
-        api_key = request.headers.get('X-API-Key') or request.headers.get('Authorization')
-        
-        if api_key and api_key.startswith('Bearer '):
-            api_key = api_key.replace('Bearer ', '')
-        
-        if not api_key:
-            return jsonify({
-                "success": False,
-                "error": "API key required",
-                "code": "MISSING_API_KEY",
-                "help": "Include your API key in the X-API-Key header"
-            }), 401
-        
+def authenticate_request():
+    """
+    Check the current request's API key and count the request against it.
+    Returns None and sets request.api_user if the key is good, otherwise
+    the error response to send instead.
+    """
+    # Get API key from header
+    api_key = request.headers.get('X-API-Key') or request.headers.get('Authorization')
+    
+    if not api_key:
+        return current_app.response_class(_MISSING_API_KEY_BODY, status=401, mimetype='application/json')
+
+    # Malformed keys are turned away here, before hashing or any lookup
+    match = _KEY_RE.fullmatch(api_key)
+    if not match:
+        return current_app.response_class(_INVALID_KEY_FORMAT_BODY, status=401, mimetype='application/json')
+    api_key = match.group(1)
+    
+    try:
         # Validate the API key
         validation = api_manager.validate_api_key(api_key)
-        
+
         if not validation["valid"]:
             return jsonify({
                 "success": False,
                 "error": validation["error"],
                 "code": "INVALID_API_KEY"
             }), 401
-        
+
         # Log usage
         api_manager.log_usage(
             api_key[:12], 
@@ -206,9 +699,24 @@ def require_api_key(f):
             request.remote_addr,
             request.headers.get('User-Agent', '')
         )
-        
-        # Add user info to request context
-        request.api_user = validation
+    except PoolExhaustedError:
+        return jsonify({
+            "success": False,
+            "error": "Authentication service is busy, please retry",
+            "code": "AUTH_UNAVAILABLE"
+        }), 503
+    
+    # Add user info to request context
+    request.api_user = validation
+    return None
+
+def require_api_key(f):
+    """Decorator to require API key authentication"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        error = authenticate_request()
+        if error is not None:
+            return error
         
         return f(*args, **kwargs)
     
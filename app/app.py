@@ -1,6 +1,7 @@
 import streamlit as st
 import sys
 import os
+import threading
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from pipeline.pipeline import MedRecommendationPipeline
 from dotenv import load_dotenv
@@ -11,7 +12,11 @@ load_dotenv()
 
 @st.cache_resource
 def init_pipeline():
-    return MedRecommendationPipeline()
+    pipeline = MedRecommendationPipeline()
+    # Warm the embedding model and index in the background so the first
+    # user query doesn't pay for it
+    threading.Thread(target=pipeline.warm_up, daemon=True).start()
+    return pipeline
 
 pipeline = init_pipeline()
 
@@ -0,0 +1,19 @@
+# Gunicorn settings for start_app.py:
+#   gunicorn -c gunicorn_conf.py start_app:app
+
+# Patch before anything else is imported: the app is preloaded in the
+# master, so its modules must already see gevent's socket and threading
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = "gevent"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_connections = 1000
+timeout = 120
+
+# Load the pipeline (embedding model, Faiss index, caches) once in the
+# master; workers share it copy-on-write instead of each loading it
+preload_app = True
@@ -0,0 +1,56 @@
+# Gunicorn settings for web_app.py:
+#   gunicorn -c gunicorn_web_conf.py web_app:app
+# (start_app.py has its own gevent settings in gunicorn_conf.py). Not named
+# gunicorn.conf.py, which gunicorn would load for every app in this directory
+
+import math
+import os
+
+
+def _cgroup_cpus():
+    """CPU limit of the container (rounded up), or None if it has none"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:  # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota <= 0:
+            return None
+        return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        return None
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Greenlets let up to worker_connections requests waiting on the LLM
+# overlap inside a worker. gunicorn monkey-patches a gevent worker itself
+# before loading the app (nothing is preloaded), so web_app doesn't patch.
+# GUNICORN_WORKER_CLASS=gthread switches to GUNICORN_THREADS threads instead
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+# Every worker loads its own pipeline (embedding model, Faiss index, caches):
+# roughly 500 MB resident each, so memory rather than CPU bounds the count.
+# One worker per CPU of the container's limit (1 under a 500m limit), else 2
+workers = int(os.environ.get("WEB_CONCURRENCY", _cgroup_cpus() or 2))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# A worker must finish loading the pipeline within the timeout, so build
+# the vector store before the first start
+timeout = 120
+# Longer than a typical load balancer's idle timeout, so it closes first
+keepalive = 65
+
+
+def post_worker_init(worker):
+    """Load the pipeline once per worker, after the app (and any gevent patching) is loaded"""
+    import web_app
+    web_app.init_pipeline()
@@ -1,30 +1,59 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
 from src.vector_store import VectorStoreBuilderCompat
-from src.recommender import MedRecommender
+from src.recommender import MedRecommender, normalize_query
+from src.batcher import MicroBatcher
 from config.config import GROQ_API_KEY,MODEL_NAME
 from utils.logger import get_logger
 from utils.custom_exception import CustomException
 
 logger = get_logger(__name__)
 
+# Queries run through retrieval once at startup; WARMUP_QUERIES_FILE may
+# list others (one per line), e.g. the most common real ones
+DEFAULT_WARMUP_QUERIES = ("paracetamol 500mg", "alternatives for amoxicillin")
+
+# Chunks retrieved per query (as_retriever()'s default)
+RETRIEVER_SEARCH_KWARGS = {"k": 4}
+
 class MedRecommendationPipeline:
-    def __init__(self,persist_dir="chroma_db"):
+    def __init__(self,persist_dir="faiss_index"):
         try:
             logger.info("Intializing Recommdation Pipeline")
 
             vector_builder = VectorStoreBuilderCompat(csv_path="data/indian_medicine_all_with_alternatives.csv" , persist_dir=persist_dir)
 
-            # Try to load existing vector store, if it fails, build a new one
+            # Try to load existing vector store, if it fails, build a new one.
+            # The plain Faiss search unless TWO_STAGE_RETRIEVAL=1 (see get_retriever)
             try:
-                retriever = vector_builder.load_vector_store().as_retriever()
+                retriever = vector_builder.get_retriever(RETRIEVER_SEARCH_KWARGS)
                 logger.info("Loaded existing vector store")
             except Exception as load_error:
                 logger.info(f"Failed to load existing vector store: {load_error}")
+                # Rebuilding takes minutes; only do it in-process when asked to
+                if os.environ.get("ALLOW_VECTOR_REBUILD") != "1":
+                    raise RuntimeError(
+                        f"No usable vector store at {persist_dir}. Run pipeline/build_pipeline.py "
+                        "or set ALLOW_VECTOR_REBUILD=1 to build it on startup"
+                    ) from load_error
                 logger.info("Building new vector store from CSV data...")
                 vector_builder.build_and_save_vectorstore()
-                retriever = vector_builder.load_vector_store().as_retriever()
+                retriever = vector_builder.get_retriever(RETRIEVER_SEARCH_KWARGS)
                 logger.info("Built and loaded new vector store")
 
-            self.recommender = MedRecommender(retriever,GROQ_API_KEY,MODEL_NAME)
+            self.recommender = MedRecommender(retriever,GROQ_API_KEY,MODEL_NAME,embeddings=vector_builder.embeddings)
+            # Concurrent queries arriving within a few ms share one retrieval/LLM batch
+            self.batcher = MicroBatcher(
+                lambda queries: self.recommender.get_recommendations(queries, return_exceptions=True),
+                max_batch=int(os.environ.get("SEARCH_BATCH_SIZE", "8")),
+                max_wait=float(os.environ.get("SEARCH_BATCH_WAIT_MS", "25")) / 1000,
+                max_concurrency=int(os.environ.get("SEARCH_BATCH_CONCURRENCY", "32"))
+            )
+            # Normalized query -> Future of the recommendation being generated for it
+            self._inflight = {}
+            self._inflight_lock = threading.Lock()
 
             logger.info("Pipleine intialized sucesfully...")
 
@@ -32,17 +61,98 @@ class MedRecommendationPipeline:
             logger.error(f"Failed to intialize pipeline {str(e)}")
             raise CustomException("Error during pipeline intialization" , e)
         
+    def warm_up(self,queries=None):
+        """
+        Run queries through the embedding model and index so the first real
+        request doesn't pay for model warm-up and cold index pages. No LLM
+        call is made, so nothing is cached and nothing is billed.
+        """
+        if queries is None:
+            queries = DEFAULT_WARMUP_QUERIES
+            path = os.environ.get("WARMUP_QUERIES_FILE")
+            if path:
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        queries = [line.strip() for line in f if line.strip()] or queries
+                except OSError as e:
+                    logger.warning(f"Could not read warm-up queries from {path}: {e}")
+        try:
+            started = time.perf_counter()
+            self.recommender.retriever.batch(list(queries))
+            logger.info(f"Warmed up retrieval with {len(queries)} queries in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            # A failed warm-up only means the first request is slower
+            logger.warning(f"Pipeline warm-up failed: {e}")
+
     def recommend(self,query:str) -> str:
         try:
             logger.info(f"Recived a query {query}")
 
-            recommendation = self.recommender.get_recommendation(query)
+            # Repeats are answered here instead of waiting out a batch window
+            recommendation = self.recommender.cached_recommendation(query)
+            if recommendation is None:
+                recommendation = self._single_flight(query)
 
             logger.info("Recommendation generated sucesfulyy...")
             return recommendation
         except Exception as e:
             logger.error(f"Failed to get recommendation {str(e)}")
             raise CustomException("Error during getting recommendation" , e)
+
+    def recommend_stream(self,query:str):
+        """
+        Yield the recommendation for query in pieces as the LLM produces
+        them. Streams are per client, so they skip the batcher and
+        single-flight; a cached answer arrives as one piece.
+        """
+        try:
+            logger.info(f"Recived a streaming query {query}")
+            yield from self.recommender.stream_recommendation(query)
+            logger.info("Recommendation streamed sucesfulyy...")
+        except Exception as e:
+            logger.error(f"Failed to stream recommendation {str(e)}")
+            raise CustomException("Error during streaming recommendation" , e)
+
+    def _single_flight(self,query:str) -> str:
+        """
+        Generate the recommendation for query, unless the same (normalized)
+        query is already being generated; then wait for that one instead
+        """
+        key = normalize_query(query)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if leader:
+            try:
+                future.set_result(self.batcher.submit(query))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._inflight_lock:
+                    del self._inflight[key]
+        else:
+            logger.info("Waiting on an identical in-flight query")
+        return future.result()
+
+    def recommend_many(self,queries:list) -> list:
+        """
+        Recommendations for several queries as one retrieval/LLM batch, in
+        order. A query that failed gets a CustomException in its place.
+        """
+        try:
+            logger.info(f"Recived {len(queries)} queries")
+            results = self.recommender.get_recommendations(queries, return_exceptions=True)
+        except Exception as e:
+            logger.error(f"Failed to get recommendations {str(e)}")
+            results = [e] * len(queries)
+
+        return [
+            CustomException("Error during getting recommendation" , result) if isinstance(result, Exception) else result
+            for result in results
+        ]
         
 
 
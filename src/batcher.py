@@ -0,0 +1,78 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads into batches of up to
+    max_batch, waiting at most max_wait seconds after the first item, and
+    hands each batch to fn(items) -> results (same order). Up to
+    max_concurrency batches run at once, so a slow batch doesn't hold up
+    the ones collected after it. A result that is an exception is raised
+    in the thread that submitted it.
+    """
+
+    def __init__(self, fn, max_batch=8, max_wait=0.025, max_concurrency=32):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency
+        self._queue = None
+        self._executor = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item):
+        """Block until item's batch has run; return its result or raise its error"""
+        future = Future()
+        self._get_queue().put((item, future))
+        return future.result()
+
+    def _get_queue(self):
+        """
+        The queue and worker thread are created on first use in each process:
+        threads don't survive a fork, e.g. of a gunicorn master that preloaded
+        the app
+        """
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency, thread_name_prefix="batch"
+                    )
+                    threading.Thread(target=self._worker_loop, args=(self._queue,), daemon=True).start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def _worker_loop(self, items_queue):
+        while True:
+            batch = [items_queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(items_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self.fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
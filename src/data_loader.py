@@ -1,11 +1,155 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pacsv
+from rapidfuzz import process, fuzz
+import csv
 import logging
 import json
+import os
+import pickle
+from utils.fingerprint import compute_fingerprint, read_fingerprint, write_fingerprint
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump when the processed output format changes so cached outputs are rebuilt
+SCHEMA_VERSION = 1
+
+# Bytes of raw CSV parsed per record batch
+BLOCK_SIZE = 8 << 20
+
+# pyarrow CSV writer settings for the processed CSV
+WRITE_OPTIONS = pacsv.WriteOptions(batch_size=16384)
+
+# Columns written to the processed CSV. A fixed schema keeps every batch
+# identical and writes categorical columns back out as plain strings
+OUTPUT_SCHEMA = pa.schema([
+    ('medicine_id', pa.int64()),
+    ('combined_info', pa.string()),
+    ('search_keywords', pa.string()),
+    ('name', pa.string()),
+    ('salt_composition', pa.string()),
+    ('alternatives', pa.string()),
+    ('price', pa.float64()),
+    ('manufacturer_name', pa.string()),
+    ('is_valid_entry', pa.bool_()),
+])
+OUTPUT_COLUMNS = OUTPUT_SCHEMA.names
+
+# Highly repetitive text columns kept as pandas categoricals
+CATEGORICAL_COLUMNS = ('manufacturer_name', 'salt_composition', 'side_effects')
+
+# Fill values for optional columns that may be missing or empty
+DEFAULTS = {
+    'manufacturer_name': 'Unknown',
+    'medicine_desc': 'No description',
+    'side_effects': 'Not specified',
+    'price': 0.0,
+}
+
+# (prefix, column) pairs that make up each generated text field
+COMBINED_INFO_FIELDS = [
+    ("DATABASE_ENTRY_START | Medicine Name: ", "name"),
+    (" | Salt Composition: ", "salt_composition"),
+    (" | Description: ", "medicine_desc"),
+    (" | Manufacturer: ", "manufacturer_name"),
+    (" | Price: ₹", "price"),
+    (" | Alternative Medicines: ", "alternatives"),
+    (" | Side Effects: ", "side_effects"),
+]
+SEARCH_KEYWORDS_FIELDS = [
+    ("EXACT_NAME: ", "name"),
+    (" | COMPOSITION: ", "salt_composition"),
+    (" | ALTERNATIVES: ", "alternatives"),
+]
+ALTERNATIVE_SEARCH_FIELDS = [
+    ("VALID_ALTERNATIVE_ENTRY | For medicine: ", "name"),
+    (" (Composition: ", "salt_composition"),
+    (") the verified alternatives are: ", "alternatives"),
+]
+PRICE_INFO_FIELDS = [
+    ("PRICE_ENTRY | Medicine: ", "name"),
+    (" | Cost: ₹", "price"),
+    (" | Alternatives: ", "alternatives"),
+]
+
+
+def _arrow_strings(series):
+    """Convert a pandas column to an Arrow string array"""
+    try:
+        arr = pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns
+        arr = pa.array(series.astype(str))
+    return arr if pa.types.is_string(arr.type) else arr.cast(pa.string())
+
+
+def _clean_raw(table):
+    """
+    Lowercase the column names and strip the medicine names of a table read
+    from the source CSV. Missing names are left null for each emitter to fill.
+    """
+    # Convert column names to lowercase for case-insensitive matching
+    table = table.rename_columns([name.lower() for name in table.column_names])
+    if 'name' in table.column_names:
+        table = table.set_column(
+            table.column_names.index('name'), 'name',
+            pc.utf8_trim_whitespace(table['name'])
+        )
+    return table
+
+
+def _csv_options(path):
+    """
+    pyarrow read/parse/convert options that mirror what pd.read_csv did:
+    skip malformed rows, treat empty cells as missing, only parse price as
+    a number. Column types are pinned up front so every streamed batch
+    shares one schema.
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f), [])
+
+    column_types = {
+        column: pa.float64() if column.lower() == 'price' else pa.string()
+        for column in header
+    }
+    return {
+        'read_options': pacsv.ReadOptions(use_threads=True, block_size=BLOCK_SIZE),
+        'parse_options': pacsv.ParseOptions(
+            newlines_in_values=True,
+            invalid_row_handler=lambda row: 'skip'
+        ),
+        'convert_options': pacsv.ConvertOptions(
+            column_types=column_types,
+            strings_can_be_null=True
+        ),
+    }
+
+
+def _load_medicine_names(names_file):
+    """Load the frozenset of lowercase medicine names written by load_and_process"""
+    with open(names_file, 'rb') as f:
+        return pickle.load(f)
+
+
+def _join_fields(df, fields, suffix=""):
+    """
+    Build prefix + column + ... + suffix for every row with a single Arrow
+    kernel instead of one pandas string addition per part
+    """
+    parts = []
+    for prefix, column in fields:
+        parts.append(prefix)
+        parts.append(_arrow_strings(df[column]))
+    parts.append(suffix)
+
+    # Missing values render as "nan", as astype(str) did
+    options = pc.JoinOptions(null_handling="replace", null_replacement="nan")
+    joined = pc.binary_join_element_wise(*parts, "", options=options)
+    return joined.to_pandas().set_axis(df.index)
+
 class MedDataLoader:
     def __init__(self, original_csv: str, processed_csv: str):
         """
@@ -18,44 +162,67 @@ class MedDataLoader:
         self.original_csv = original_csv
         self.processed_csv = processed_csv
         self.medicine_names = set()  # Track all medicine names for validation
+        self._raw = None  # Cleaned source table, once load_for_alternative_search read it
 
-    def load_and_process(self):
+    def load_and_process(self, force=False):
         """
         Load and process the medicine dataset with improved structure
-        to prevent hallucinations
+        to prevent hallucinations.
+
+        The CSV is streamed with pyarrow's multi-threaded reader in
+        BLOCK_SIZE batches and each processed batch is appended to the
+        output, so memory stays flat regardless of the input size. A table
+        load_for_alternative_search already read is reused instead.
+
+        If the source CSV and SCHEMA_VERSION match the fingerprint stored
+        by the last run, the existing outputs are reused unless force is set.
         """
         try:
+            validation_file = self.processed_csv.replace('.csv', '_validation.json')
+            names_file = validation_file.replace('.json', '.pkl')
+            fingerprint_file = self.processed_csv.replace('.csv', '.fingerprint.json')
+            fingerprint = compute_fingerprint(self.original_csv, SCHEMA_VERSION)
+
+            if (not force
+                    and read_fingerprint(fingerprint_file) == fingerprint
+                    and os.path.exists(self.processed_csv)
+                    and os.path.exists(validation_file)
+                    and os.path.exists(names_file)):
+                logger.info(f"{self.original_csv} unchanged since last run, reusing {self.processed_csv}")
+                self.medicine_names = set(_load_medicine_names(names_file))
+                logger.info(f"Loaded {len(self.medicine_names)} unique medicines")
+                return self.processed_csv
+
             # Load the CSV file
             logger.info(f"Loading medicine data from {self.original_csv}")
-            df = pd.read_csv(self.original_csv, encoding='utf-8', on_bad_lines='skip')
-            
-            # Convert column names to lowercase for case-insensitive matching
-            df.columns = df.columns.str.lower()
-            
-            # Check for required columns
-            required_columns = {
-                'name', 
-                'salt_composition', 
-                'alternatives',
-                'manufacturer_name',
-                'medicine_desc'
-            }
-            
-            missing = required_columns - set(df.columns)
-            if missing:
-                logger.warning(f"Available columns: {list(df.columns)}")
-                essential_columns = {'name', 'salt_composition', 'alternatives'}
-                essential_missing = essential_columns - set(df.columns)
-                if essential_missing:
-                    raise ValueError(f"Missing essential columns: {essential_missing}")
-                else:
-                    logger.warning(f"Some columns missing: {missing}, proceeding with available columns")
-            
-            # Clean and standardize medicine names
-            df['name'] = df['name'].fillna('Unknown Medicine').str.strip()
-            
-            # Store all valid medicine names for validation
-            self.medicine_names = set(df['name'].str.lower().unique())
+
+            self.medicine_names = set()
+            summary_state = self._new_summary_state()
+            total_records = 0
+
+            logger.info(f"Saving processed data to {self.processed_csv}")
+            writer = None
+            try:
+                for batch in self._iter_raw_batches():
+                    if batch.num_rows == 0:
+                        continue
+                    chunk = self._process_chunk(batch.to_pandas(), first_id=total_records + 1, check_columns=total_records == 0)
+
+                    # Save processed data with additional validation columns
+                    table = pa.Table.from_pandas(chunk, schema=OUTPUT_SCHEMA, preserve_index=False)
+                    if writer is None:
+                        writer = pacsv.CSVWriter(self.processed_csv, OUTPUT_SCHEMA, write_options=WRITE_OPTIONS)
+                    writer.write_table(table)
+
+                    self._update_summary_state(summary_state, chunk)
+                    total_records += len(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            if total_records == 0:
+                pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(self.processed_csv, index=False, encoding='utf-8')
+
             logger.info(f"Loaded {len(self.medicine_names)} unique medicines")
             
             # Log sample medicines for verification
@@ -68,53 +235,7 @@ class MedDataLoader:
                 exists = med.lower() in self.medicine_names
                 logger.info(f"Medicine '{med}': {'FOUND' if exists else 'NOT FOUND'} in database")
             
-            # Handle missing values with clear indicators
-            df['salt_composition'] = df['salt_composition'].fillna('Composition not specified')
-            df['alternatives'] = df['alternatives'].fillna('No alternatives listed')
-            df['manufacturer_name'] = df.get('manufacturer_name', pd.Series(['Unknown'] * len(df))).fillna('Unknown')
-            df['medicine_desc'] = df.get('medicine_desc', pd.Series(['No description'] * len(df))).fillna('No description')
-            df['side_effects'] = df.get('side_effects', pd.Series(['Not specified'] * len(df))).fillna('Not specified')
-            df['price'] = df.get('price', pd.Series([0.0] * len(df))).fillna(0.0)
-            
-            # IMPORTANT: Create structured combined info with validation markers
-            logger.info("Creating structured information fields for vector search")
-            
-            # Add validation prefix to prevent hallucination
-            df['combined_info'] = (
-                "DATABASE_ENTRY_START | " +
-                "Medicine Name: " + df['name'].astype(str) + 
-                " | Salt Composition: " + df['salt_composition'].astype(str) +
-                " | Description: " + df['medicine_desc'].astype(str) +
-                " | Manufacturer: " + df['manufacturer_name'].astype(str) +
-                " | Price: ₹" + df['price'].astype(str) +
-                " | Alternative Medicines: " + df['alternatives'].astype(str) +
-                " | Side Effects: " + df['side_effects'].astype(str) +
-                " | DATABASE_ENTRY_END"
-            )
-            
-            # Create search keywords with exact medicine names
-            df['search_keywords'] = (
-                "EXACT_NAME: " + df['name'].astype(str) + " | " +
-                "COMPOSITION: " + df['salt_composition'].astype(str) + " | " +
-                "ALTERNATIVES: " + df['alternatives'].astype(str).replace(',', ' ')
-            )
-            
-            # Add a validation field
-            df['is_valid_entry'] = True
-            df['medicine_id'] = range(1, len(df) + 1)
-            
-            # Save processed data with additional validation columns
-            logger.info(f"Saving processed data to {self.processed_csv}")
-            df[['medicine_id', 'combined_info', 'search_keywords', 'name', 
-                'salt_composition', 'alternatives', 'price', 'manufacturer_name',
-                'is_valid_entry']].to_csv(
-                self.processed_csv, 
-                index=False, 
-                encoding='utf-8'
-            )
-            
             # Save a separate validation file with all medicine names
-            validation_file = self.processed_csv.replace('.csv', '_validation.json')
             with open(validation_file, 'w', encoding='utf-8') as f:
                 json.dump({
                     'total_medicines': len(self.medicine_names),
@@ -122,29 +243,131 @@ class MedDataLoader:
                     'processed_date': pd.Timestamp.now().isoformat()
                 }, f, indent=2, ensure_ascii=False)
             logger.info(f"Validation file saved to {validation_file}")
+
+            # Names are already lowercase; the pickle loads without any per-name work
+            with open(names_file, 'wb') as f:
+                pickle.dump(frozenset(self.medicine_names), f, protocol=5)
             
-            logger.info(f"Successfully processed {len(df)} medicine records")
+            logger.info(f"Successfully processed {total_records} medicine records")
             
             # Create a summary report
-            self.create_data_summary(df)
+            self.create_data_summary(self._finish_summary(summary_state))
+
+            # Written last so an interrupted run is never treated as cached
+            write_fingerprint(fingerprint_file, fingerprint)
             
             return self.processed_csv
             
         except Exception as e:
             logger.error(f"Error processing medicine data: {e}")
             raise
-    
-    def create_data_summary(self, df):
-        """Create a summary of the processed data for quality checking"""
-        summary = {
-            'total_records': len(df),
-            'unique_medicines': len(df['name'].unique()),
-            'medicines_with_alternatives': len(df[df['alternatives'] != 'No alternatives listed']),
-            'medicines_with_price': len(df[df['price'] > 0]),
-            'unique_manufacturers': len(df['manufacturer_name'].unique()),
-            'unique_compositions': len(df['salt_composition'].unique())
-        }
+
+    def _load_raw(self):
+        """
+        Read the whole source CSV once (see _clean_raw) and keep it, for
+        load_for_alternative_search, which needs every row at once
+        """
+        if self._raw is None:
+            self._raw = _clean_raw(pacsv.read_csv(self.original_csv, **_csv_options(self.original_csv)))
+        return self._raw
+
+    def _iter_raw_batches(self):
+        """Cleaned record batches of the source CSV, streamed unless already read"""
+        if self._raw is not None:
+            yield from self._raw.to_batches()
+            return
+        for batch in pacsv.open_csv(self.original_csv, **_csv_options(self.original_csv)):
+            yield from _clean_raw(pa.Table.from_batches([batch])).to_batches()
+
+    def _process_chunk(self, df, first_id=1, check_columns=True):
+        """Clean one chunk of the raw CSV and add the generated fields"""
+        # Check for required columns
+        if check_columns:
+            required_columns = {
+                'name', 
+                'salt_composition', 
+                'alternatives',
+                'manufacturer_name',
+                'medicine_desc'
+            }
+            
+            missing = required_columns - set(df.columns)
+            if missing:
+                logger.warning(f"Available columns: {list(df.columns)}")
+                essential_columns = {'name', 'salt_composition', 'alternatives'}
+                essential_missing = essential_columns - set(df.columns)
+                if essential_missing:
+                    raise ValueError(f"Missing essential columns: {essential_missing}")
+                else:
+                    logger.warning(f"Some columns missing: {missing}, proceeding with available columns")
+        
+        # Clean and standardize medicine names
+        df['name'] = df['name'].fillna('Unknown Medicine')
+        
+        # Store all valid medicine names for validation
+        # Lowercase the distinct names only, not every row
+        self.medicine_names.update(name.lower() for name in df['name'].unique())
+        
+        # Handle missing values with clear indicators
+        df['salt_composition'] = df['salt_composition'].fillna('Composition not specified')
+        df['alternatives'] = df['alternatives'].fillna('No alternatives listed')
+        for column, default in DEFAULTS.items():
+            if column in df.columns:
+                df[column] = df[column].fillna(default)
+            else:
+                # Scalar broadcast, no throwaway default Series
+                df[column] = default
+        
+        # One shared string per distinct value instead of one per row
+        for column in CATEGORICAL_COLUMNS:
+            df[column] = df[column].astype('category')
         
+        # IMPORTANT: Create structured combined info with validation markers
+        # Add validation prefix to prevent hallucination
+        df['combined_info'] = _join_fields(df, COMBINED_INFO_FIELDS, " | DATABASE_ENTRY_END")
+        
+        # Create search keywords with exact medicine names
+        df['search_keywords'] = _join_fields(df, SEARCH_KEYWORDS_FIELDS)
+        
+        # Add a validation field
+        df['is_valid_entry'] = True
+        df['medicine_id'] = range(first_id, first_id + len(df))
+        return df
+
+    @staticmethod
+    def _new_summary_state():
+        return {
+            'total_records': 0,
+            'medicines_with_alternatives': 0,
+            'medicines_with_price': 0,
+            'names': set(),
+            'manufacturers': set(),
+            'compositions': set()
+        }
+
+    @staticmethod
+    def _update_summary_state(state, df):
+        """Fold one processed chunk into the running summary"""
+        state['total_records'] += len(df)
+        state['medicines_with_alternatives'] += int((df['alternatives'] != 'No alternatives listed').sum())
+        state['medicines_with_price'] += int((df['price'] > 0).sum())
+        state['names'].update(df['name'].unique())
+        state['manufacturers'].update(df['manufacturer_name'].cat.categories)
+        state['compositions'].update(df['salt_composition'].cat.categories)
+
+    @staticmethod
+    def _finish_summary(state):
+        return {
+            'total_records': state['total_records'],
+            'unique_medicines': len(state['names']),
+            'medicines_with_alternatives': state['medicines_with_alternatives'],
+            'medicines_with_price': state['medicines_with_price'],
+            'unique_manufacturers': len(state['manufacturers']),
+            'unique_compositions': len(state['compositions'])
+        }
+    
+    def create_data_summary(self, summary):
+        """Log and save a summary of the processed data for quality checking"""
         logger.info("Data Summary:")
         for key, value in summary.items():
             logger.info(f"  {key}: {value}")
@@ -168,40 +391,29 @@ class MedDataLoader:
         """
         try:
             logger.info("Creating alternative medicine search dataset")
-            df = pd.read_csv(self.original_csv, encoding='utf-8', on_bad_lines='skip')
-            
-            # Convert column names to lowercase
-            df.columns = df.columns.str.lower()
+            df = self._load_raw().to_pandas()
             
             # Clean medicine names
-            df['name'] = df['name'].fillna('Unknown').str.strip()
+            df['name'] = df['name'].fillna('Unknown')
             
             # Create alternative-focused combined field with validation markers
-            df['alternative_search'] = (
-                "VALID_ALTERNATIVE_ENTRY | " +
-                "For medicine: " + df['name'].astype(str) +
-                " (Composition: " + df['salt_composition'].astype(str) + ") " +
-                "the verified alternatives are: " + df['alternatives'].astype(str) +
-                ". These are medicines with similar therapeutic effects. " +
-                "| END_ALTERNATIVE_ENTRY"
+            df['alternative_search'] = _join_fields(
+                df, ALTERNATIVE_SEARCH_FIELDS,
+                ". These are medicines with similar therapeutic effects. | END_ALTERNATIVE_ENTRY"
             )
             
             # Create a price comparison field
-            df['price_info'] = (
-                "PRICE_ENTRY | Medicine: " + df['name'].astype(str) + 
-                " | Cost: ₹" + df['price'].astype(str) +
-                " | Alternatives: " + df['alternatives'].astype(str) +
-                " | END_PRICE_ENTRY"
-            )
+            df['price_info'] = _join_fields(df, PRICE_INFO_FIELDS, " | END_PRICE_ENTRY")
             
             # Add validation column
             df['is_database_verified'] = True
             
             # Save alternative-focused dataset
             alternative_csv = self.processed_csv.replace('.csv', '_alternatives.csv')
-            df[['alternative_search', 'price_info', 'name', 'alternatives', 
-                'salt_composition', 'price', 'is_database_verified']].to_csv(
+            df.to_csv(
                 alternative_csv,
+                columns=['alternative_search', 'price_info', 'name', 'alternatives',
+                         'salt_composition', 'price', 'is_database_verified'],
                 index=False,
                 encoding='utf-8'
             )
@@ -216,10 +428,18 @@ class MedDataLoader:
 # Validator class to use with your retrieval system
 class MedicineValidator:
     def __init__(self, validation_file_path):
-        """Load the validation data"""
-        with open(validation_file_path, 'r', encoding='utf-8') as f:
-            self.validation_data = json.load(f)
-        self.valid_medicines = set([m.lower() for m in self.validation_data['medicine_names']])
+        """
+        Load the validation data. A *_validation.json path is served from
+        the pickled name set written next to it when that exists.
+        """
+        names_file = validation_file_path.replace('.json', '.pkl')
+        if os.path.exists(names_file):
+            self.valid_medicines = _load_medicine_names(names_file)
+        else:
+            with open(validation_file_path, 'r', encoding='utf-8') as f:
+                self.valid_medicines = frozenset(m.lower() for m in json.load(f)['medicine_names'])
+        # Sorted choices for fuzzy matching, built on the first suggestion
+        self._choices = None
         logger.info(f"Loaded {len(self.valid_medicines)} valid medicine names for validation")
     
     def is_valid_medicine(self, medicine_name):
@@ -228,14 +448,16 @@ class MedicineValidator:
     
     def get_similar_names(self, medicine_name):
         """Get similar medicine names for suggestions"""
-        from difflib import get_close_matches
-        similar = get_close_matches(
-            medicine_name.lower(), 
-            self.valid_medicines, 
-            n=5, 
-            cutoff=0.6
+        if self._choices is None:
+            self._choices = tuple(sorted(self.valid_medicines))
+        matches = process.extract(
+            medicine_name.lower(),
+            self._choices,
+            scorer=fuzz.WRatio,
+            limit=5,
+            score_cutoff=60
         )
-        return similar
+        return [match for match, score, _ in matches]
 
 # Example usage with validation
 if __name__ == "__main__":
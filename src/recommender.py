@@ -1,82 +1,337 @@
-from langchain.chains import RetrievalQA
 from langchain_groq import ChatGroq
 from src.prompt_template import (
-    get_med_prompt, 
-    get_med_search_prompt, 
-    get_price_comparison_prompt, 
-    get_composition_search_prompt
+    format_med_prompt,
+    format_med_search_prompt,
+    format_price_comparison_prompt,
+    format_composition_search_prompt
 )
+from src.semantic_cache import SemanticCache
+from utils.logger import get_logger
+from collections import OrderedDict
+import hashlib
+import os
 import re
+import threading
+import time
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = get_logger(__name__)
+
+
+# Keyword lists in priority order: the first type with any keyword in the
+# query wins, otherwise the query is 'general'. Keywords match as substrings,
+# not whole words, so 'cheap' also catches 'cheapest' and 'treat' catches
+# 'treatment'; all of them are found in one pass by _match_keywords
+QUERY_TYPE_KEYWORDS = (
+    # Price-related keywords
+    ('price', ['price', 'cost', 'cheap', 'expensive', 'budget', 'affordable', 
+               'savings', 'compare price', 'cheaper', 'costlier']),
+    # Composition-related keywords  
+    ('composition', ['composition', 'salt', 'ingredient', 'contains', 
+                     'active ingredient', 'chemical', 'formula']),
+    # Search-related keywords
+    ('search', ['condition', 'disease', 'symptom', 'treatment', 'cure', 
+                'for', 'help with', 'treat']),
+)
+
+
+def _build_keyword_matcher():
+    """
+    Compile every keyword into one matcher that yields the priority (index
+    into QUERY_TYPE_KEYWORDS) of each keyword found in a lowercase query
+    """
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for priority, (_, keywords) in enumerate(QUERY_TYPE_KEYWORDS):
+            for keyword in keywords:
+                automaton.add_word(keyword, priority)
+        automaton.make_automaton()
+        return lambda text: (priority for _, priority in automaton.iter(text))
+
+    # Zero-width lookahead tries every start position; alternatives are in
+    # priority order, so each position reports its highest-priority keyword
+    priorities = {}
+    for priority, (_, keywords) in enumerate(QUERY_TYPE_KEYWORDS):
+        for keyword in keywords:
+            priorities.setdefault(keyword, priority)
+    pattern = re.compile("(?=(" + "|".join(map(re.escape, priorities)) + "))")
+    return lambda text: (priorities[m.group(1)] for m in pattern.finditer(text))
+
+
+_match_keywords = _build_keyword_matcher()
+
+# Semantic response cache; set SEMANTIC_CACHE_PATH="" to keep it in memory only
+SEMANTIC_CACHE_PATH = os.environ.get("SEMANTIC_CACHE_PATH", "semantic_cache.pkl")
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", "3600"))
+# Exact-match responses kept in front of the semantic cache (same TTL)
+EXACT_CACHE_SIZE = int(os.environ.get("EXACT_CACHE_SIZE", "4096"))
+# Optional Redis layer behind the exact cache, shared by every worker process
+REDIS_URL = os.environ.get("REDIS_URL", "")
+REDIS_CACHE_TTL = int(os.environ.get("REDIS_CACHE_TTL", "900"))
+# MEMOIZE=0 turns all response caching off, e.g. while tuning prompts
+MEMOIZE = os.environ.get("MEMOIZE", "1") != "0"
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so trivially different repeats match"""
+    return " ".join(query.lower().split())
+
+
+def _shared_key(exact_key) -> str:
+    """Redis key for an exact-cache key: short, fixed length, no raw query text"""
+    normalized, query_type = exact_key
+    digest = hashlib.blake2b(f"{query_type}\0{normalized}".encode(), digest_size=16).hexdigest()
+    return f"rec:{digest}"
 
 
 class MedRecommender:
-    def __init__(self,retriever,api_key:str,model_name:str):
+    def __init__(self,retriever,api_key:str,model_name:str,embeddings=None):
 
         self.retriever=retriever
+        self.embeddings=embeddings
         self.api_key=api_key
         self.model_name=model_name
         self.llm=ChatGroq(api_key=self.api_key,model_name=self.model_name,temperature=0)
         
-        # Store all prompt templates
-        self.prompts = {
-            'general': get_med_prompt(),
-            'search': get_med_search_prompt(),
-            'price': get_price_comparison_prompt(),
-            'composition': get_composition_search_prompt()
+        # Prompt templates as plain str.format functions
+        self.prompt_formatters = {
+            'general': format_med_prompt,
+            'search': format_med_search_prompt,
+            'price': format_price_comparison_prompt,
+            'composition': format_composition_search_prompt
         }
-        
-        # Default QA chain with general prompt
-        self.qa_chain=RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.retriever,
-            return_source_documents=True,
-            chain_type_kwargs={"prompt":self.prompts['general']}
-        )
+
+        # Repeated queries (retries, bots) are answered from a small LRU
+        # keyed on the normalized text, before anything is embedded
+        self._exact_cache=OrderedDict()
+        self._exact_lock=threading.Lock()
+
+        # Exact repeats answered by another worker process
+        self.shared_cache=None
+        if MEMOIZE and REDIS_URL:
+            if redis is None:
+                logger.warning("REDIS_URL is set but the redis package is not installed; shared cache disabled")
+            else:
+                self.shared_cache=redis.Redis.from_url(REDIS_URL)
+
+        # Near-duplicate queries are answered from the cache without
+        # retrieval or an LLM call; needs the embeddings to compare queries
+        self.cache=None
+        if MEMOIZE and self.embeddings is not None:
+            self.cache=SemanticCache(
+                self.embeddings,
+                threshold=SEMANTIC_CACHE_THRESHOLD,
+                ttl=SEMANTIC_CACHE_TTL,
+                path=SEMANTIC_CACHE_PATH or None
+            )
 
     def _detect_query_type(self, query: str) -> str:
         """
         Detect the type of query to use the appropriate prompt
         """
-        query_lower = query.lower()
+        # One pass over the query for all keyword lists
+        best = len(QUERY_TYPE_KEYWORDS)
+        for priority in _match_keywords(query.lower()):
+            if priority < best:
+                best = priority
+                if best == 0:
+                    break
         
-        # Price-related keywords
-        price_keywords = ['price', 'cost', 'cheap', 'expensive', 'budget', 'affordable', 
-                         'savings', 'compare price', 'cheaper', 'costlier']
-        
-        # Composition-related keywords  
-        composition_keywords = ['composition', 'salt', 'ingredient', 'contains', 
-                               'active ingredient', 'chemical', 'formula']
-        
-        # Search-related keywords
-        search_keywords = ['condition', 'disease', 'symptom', 'treatment', 'cure', 
-                          'for', 'help with', 'treat']
-        
-        if any(keyword in query_lower for keyword in price_keywords):
-            return 'price'
-        elif any(keyword in query_lower for keyword in composition_keywords):
-            return 'composition'
-        elif any(keyword in query_lower for keyword in search_keywords):
-            return 'search'
+        if best < len(QUERY_TYPE_KEYWORDS):
+            return QUERY_TYPE_KEYWORDS[best][0]
         else:
             return 'general'
     
+    def cached_recommendation(self,query:str):
+        """
+        The in-process cached response for query, or None. Cheap enough to
+        try before queueing the query for a batch.
+        """
+        return self._exact_get((normalize_query(query), self._detect_query_type(query)))
+
     def get_recommendation(self,query:str):
         """
         Get medicine recommendation using the most appropriate prompt
         """
-        # Detect query type and use appropriate prompt
+        result = self.get_recommendations([query], return_exceptions=True)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def get_recommendations(self,queries,return_exceptions:bool=False):
+        """
+        Recommendations for several queries at once, in order. Repeated
+        queries are answered once; retrieval and LLM calls for the rest run
+        as one batch. With return_exceptions, a failed query's exception
+        takes its place in the result instead of being raised.
+        """
+        results = {}
+        exact_keys = {}
+        for query in dict.fromkeys(queries):
+            # Detect query type to pick the prompt
+            query_type = self._detect_query_type(query)
+            exact_key = (normalize_query(query), query_type)
+            cached = self._exact_get(exact_key)
+            if cached is not None:
+                results[query] = cached
+                continue
+            exact_keys[query] = exact_key
+
+        # One round trip for every query this process hasn't seen
+        for query, cached in zip(list(exact_keys), self._shared_get(list(exact_keys.values()))):
+            if cached is not None:
+                results[query] = cached
+                self._exact_put(exact_keys.pop(query), cached)
+
+        pending = {}  # query -> (query_type, cache vector)
+        for query, exact_key in exact_keys.items():
+            query_type = exact_key[1]
+            vector = None
+            if self.cache is not None:
+                cached, vector = self.cache.lookup(query, query_type)
+                if cached is not None:
+                    results[query] = cached
+                    self._exact_put(exact_key, cached)
+                    continue
+            pending[query] = (query_type, vector)
+
+        if pending:
+            # Retrieve, stuff and call the LLM directly; same prompt text as a
+            # "stuff" RetrievalQA chain without building the chain machinery
+            misses = list(pending)
+            prompts = []
+            for query, docs in zip(misses, self._retrieve(misses, [pending[query][1] for query in misses])):
+                context = "\n\n".join(doc.page_content for doc in docs)
+                prompts.append(self.prompt_formatters[pending[query][0]](context=context, question=query))
+
+            answered = {}
+            for query, message in zip(misses, self.llm.batch(prompts, return_exceptions=True)):
+                if isinstance(message, Exception):
+                    if not return_exceptions:
+                        raise message
+                    results[query] = message
+                    continue
+                results[query] = message.content
+                query_type, vector = pending[query]
+                self._exact_put(exact_keys[query], message.content)
+                answered[exact_keys[query]] = message.content
+                if self.cache is not None:
+                    self.cache.put(vector, message.content, query_type, query)
+            self._shared_put(answered)
+
+        return [results[query] for query in queries]
+
+    def stream_recommendation(self,query:str):
+        """
+        Yield the recommendation for query in pieces as the LLM generates
+        it. A cached response is yielded whole. The full response is cached
+        like get_recommendations' are once the stream completes.
+        """
         query_type = self._detect_query_type(query)
-        
-        # Create QA chain with the appropriate prompt
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.retriever,
-            return_source_documents=True,
-            chain_type_kwargs={"prompt":self.prompts[query_type]}
-        )
-        
-        result = qa_chain.invoke({"query":query})
-        return result['result']
-    
+        exact_key = (normalize_query(query), query_type)
+        cached = self._exact_get(exact_key)
+        if cached is None:
+            cached = self._shared_get([exact_key])[0]
+        vector = None
+        if cached is None and self.cache is not None:
+            cached, vector = self.cache.lookup(query, query_type)
+        if cached is not None:
+            self._exact_put(exact_key, cached)
+            yield cached
+            return
+
+        docs = self._retrieve([query], [vector])[0]
+        context = "\n\n".join(doc.page_content for doc in docs)
+        prompt = self.prompt_formatters[query_type](context=context, question=query)
+
+        pieces = []
+        for chunk in self.llm.stream(prompt):
+            if chunk.content:
+                pieces.append(chunk.content)
+                yield chunk.content
+
+        response = "".join(pieces)
+        self._exact_put(exact_key, response)
+        self._shared_put({exact_key: response})
+        if self.cache is not None:
+            self.cache.put(vector, response, query_type, query)
+
+    def _retrieve(self, queries, vectors):
+        """
+        Documents for each query. A query whose vector the semantic cache
+        already computed (vectors[i], or None) is searched by that vector
+        instead of being embedded again.
+        """
+        docs = [None] * len(queries)
+        for i, vector in enumerate(vectors):
+            if vector is not None:
+                docs[i] = self._documents_for_vector(vector)
+        rest = [i for i, found in enumerate(docs) if found is None]
+        if rest:
+            for i, found in zip(rest, self.retriever.batch([queries[i] for i in rest])):
+                docs[i] = found
+        return docs
+
+    def _documents_for_vector(self, vector):
+        """The retriever's documents for a (1, dim) query vector, or None if it only takes text"""
+        if hasattr(self.retriever, "documents_for_vector"):
+            return self.retriever.documents_for_vector(vector[0])
+        vectorstore = getattr(self.retriever, "vectorstore", None)
+        if vectorstore is None or getattr(self.retriever, "search_type", None) != "similarity":
+            return None
+        return vectorstore.similarity_search_by_vector(vector[0].tolist(), **self.retriever.search_kwargs)
+
+    def _shared_get(self, keys):
+        """Cached responses (or None) for exact-cache keys from Redis; all misses if it is down"""
+        if self.shared_cache is None or not keys:
+            return [None] * len(keys)
+        try:
+            values = self.shared_cache.mget([_shared_key(key) for key in keys])
+        except redis.RedisError as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return [None] * len(keys)
+        return [value.decode() if value is not None else None for value in values]
+
+    def _shared_put(self, responses):
+        if self.shared_cache is None or not responses:
+            return
+        try:
+            with self.shared_cache.pipeline(transaction=False) as pipe:
+                for key, response in responses.items():
+                    pipe.setex(_shared_key(key), REDIS_CACHE_TTL, response)
+                pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def _exact_get(self, key):
+        if not MEMOIZE:
+            return None
+        with self._exact_lock:
+            cached = self._exact_cache.get(key)
+            if cached is None:
+                return None
+            response, deadline = cached
+            if time.monotonic() >= deadline:
+                del self._exact_cache[key]
+                return None
+            self._exact_cache.move_to_end(key)
+            return response
+
+    def _exact_put(self, key, response):
+        if not MEMOIZE:
+            return
+        with self._exact_lock:
+            self._exact_cache[key] = (response, time.monotonic() + SEMANTIC_CACHE_TTL)
+            self._exact_cache.move_to_end(key)
+            while len(self._exact_cache) > EXACT_CACHE_SIZE:
+                self._exact_cache.popitem(last=False)
@@ -0,0 +1,132 @@
+import atexit
+import os
+import pickle
+import re
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Nearest cached queries checked per lookup, so a closer entry of another
+# query type, or an expired one, doesn't hide a valid match behind it
+LOOKUP_CANDIDATES = 8
+
+# Numbers in a query with any unit right after them ("650", "500mg", "0.5 %").
+# Embeddings barely tell "Dolo 650" from "Dolo 500", so a cached answer is
+# only served to a query with exactly the same numbers and units
+_STRENGTH_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(mcg|mg|µg|ml|iu|g|%)?(?![a-z])")
+
+
+def strength_tokens(query):
+    """Sorted (number, unit) pairs in the lowercased query"""
+    return tuple(sorted(_STRENGTH_RE.findall(query.lower())))
+
+
+class SemanticCache:
+    """
+    Response cache keyed by query embedding. A query whose cosine similarity
+    to a cached query of the same type, with the same strengths (see
+    strength_tokens), reaches `threshold` gets the cached response, skipping
+    retrieval and the LLM call.
+    """
+
+    def __init__(self, embeddings, threshold=0.95, ttl=3600.0, max_entries=10_000, path=None):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._index = None
+        self._vectors = []   # kept so the index can be rebuilt on eviction
+        self._entries = []   # (response, query_type, created_at, strengths), parallel to the index
+
+        if path and os.path.exists(path):
+            try:
+                self._load()
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable semantic cache {path}: {e}")
+        if path:
+            atexit.register(self.save)
+
+    def lookup(self, query, query_type):
+        """
+        Return (response, vector). response is None on a miss; hand vector
+        to retrieval and put() so the query isn't embedded again.
+        """
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vector)
+
+        strengths = strength_tokens(query)
+        hit = None
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return None, vector
+            scores, ids = self._index.search(vector, min(LOOKUP_CANDIDATES, self._index.ntotal))
+            now = time.time()
+            # Nearest first; nothing further down can reach the threshold
+            for score, i in zip(scores[0].tolist(), ids[0].tolist()):
+                if i < 0 or score < self.threshold:
+                    break
+                response, cached_type, created_at, cached_strengths = self._entries[i]
+                if (cached_type == query_type and cached_strengths == strengths
+                        and now - created_at <= self.ttl):
+                    hit = response
+                    break
+
+        if hit is None:
+            return None, vector
+        logger.info(f"Semantic cache hit (similarity {score:.3f})")
+        return hit, vector
+
+    def put(self, vector, response, query_type, query):
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vector.shape[1])
+            if len(self._entries) >= self.max_entries:
+                self._evict()
+            self._index.add(vector)
+            self._vectors.append(vector[0])
+            self._entries.append((response, query_type, time.time(), strength_tokens(query)))
+
+    def _evict(self):
+        """Drop expired entries, then the oldest, down to 3/4 of max_entries"""
+        cutoff = time.time() - self.ttl
+        keep = [i for i, entry in enumerate(self._entries) if entry[2] >= cutoff]
+        keep = keep[-(self.max_entries * 3 // 4):]
+        self._vectors = [self._vectors[i] for i in keep]
+        self._entries = [self._entries[i] for i in keep]
+        self._index.reset()
+        if self._vectors:
+            self._index.add(np.vstack(self._vectors))
+
+    def save(self):
+        """Write the cache to path so it survives a restart"""
+        if not self.path:
+            return
+        with self._lock:
+            state = {"vectors": list(self._vectors), "entries": list(self._entries)}
+        # Forked workers each save their own copy; last one out wins
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=5)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        if any(len(entry) != 4 for entry in state["entries"]):
+            # Written before entries carried their strengths
+            raise ValueError("outdated entry format")
+        self._vectors = state["vectors"]
+        self._entries = state["entries"]
+        if self._vectors:
+            self._index = faiss.IndexFlatIP(len(self._vectors[0]))
+            self._index.add(np.vstack(self._vectors))
+        logger.info(f"Loaded {len(self._entries)} cached responses from {self.path}")
@@ -1,11 +1,24 @@
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_chroma import Chroma
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.document_loaders.csv_loader import CSVLoader
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
 from langchain_huggingface import HuggingFaceEmbeddings
+import faiss
+import hashlib
+import numpy as np
+import torch
 import warnings
 import os
+import pickle
 import shutil
 from pathlib import Path
+from typing import Any, List
+from utils.fingerprint import compute_fingerprint, read_fingerprint, write_fingerprint
 
 # Suppress deprecation warnings for now
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -13,22 +26,261 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 from dotenv import load_dotenv
 load_dotenv()
 
+# Bump when chunking or embedding settings change so stores are rebuilt
+VECTOR_SCHEMA_VERSION = 3
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# Texts per forward pass when embedding
+EMBED_BATCH_SIZE = 256
+# Chunks embedded and added to the index at a time during a build
+EMBED_BLOCK_SIZE = 4096
+# Each CSV row is one medicine and becomes one document; only rows longer
+# than this are split
+ROW_CHUNK_SIZE = 1000
+# Model weights/activations dtype; bfloat16 halves memory traffic on CPU.
+# Set EMBEDDING_DTYPE=float32 on CPUs without native bf16 support
+EMBEDDING_DTYPE = os.environ.get("EMBEDDING_DTYPE", "bfloat16")
+# "torch" runs the sentence-transformers model; "onnx" runs an ONNX export
+# with onnxruntime instead, e.g. int8-quantized for AVX-512 VNNI:
+#   optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 onnx_mini/
+#   optimum-cli onnxruntime quantize --avx512_vnni --onnx_model onnx_mini/ -o onnx_mini_int8/
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_PATH = os.environ.get("EMBEDDING_ONNX_PATH", "onnx_mini_int8/model_quantized.onnx")
+# Identifies which vectors a model setup produces; stores and cached
+# embeddings from a different one are rebuilt rather than mixed
+EMBEDDING_VARIANT = (
+    f"{EMBEDDING_MODEL}:onnx:{os.path.basename(EMBEDDING_ONNX_PATH)}" if EMBEDDING_BACKEND == "onnx"
+    else f"{EMBEDDING_MODEL}:{EMBEDDING_DTYPE}"
+)
+
+# Below this many vectors an exact flat index is both fast and exact; IVF
+# and PQ need tens of thousands of training points to be worth it
+FLAT_INDEX_MAX = 20_000
+# Upper bound on IVF lists and PQ sub-quantizers (32 bytes per vector)
+IVF_MAX_LISTS = 4096
+PQ_SUBQUANTIZERS = 32
+# OPQ/IVF/PQ are trained on a random sample of at most this many vectors
+TRAIN_SAMPLE_MAX = 50_000
+# How stored vectors are encoded: product quantization (32 bytes), scalar
+# fp16 (768 bytes) or int8 (384 bytes), or raw float32 ("none")
+QUANTIZATION_MODES = ("pq", "fp16", "int8", "none")
+SQ_ENCODINGS = {"fp16": "SQfp16", "int8": "SQ8", "none": "Flat"}
+# IVF lists probed per query unless search_kwargs says otherwise
+DEFAULT_NPROBE = 16
+# HNSW search effort when the coarse quantizer picks those lists
+DEFAULT_QUANTIZER_EF_SEARCH = 16
+# Polysemous filtering skips PQ codes further than this Hamming distance from
+# the query code before computing distances; 0 disables it. Useful values
+# depend on the code size (256 bits for PQ32x8), so tune against recall
+DEFAULT_POLYSEMOUS_HT = 0
+# Opt-in two-stage retrieval (TWO_STAGE_RETRIEVAL=1): a 1-bit-per-dimension
+# copy of the vectors is scanned for a shortlist, which is re-ranked against
+# the exact float32 vectors. Off by default: the scan is linear in the store
+# size, where the IVF search only visits nprobe lists
+TWO_STAGE_RETRIEVAL = os.environ.get("TWO_STAGE_RETRIEVAL", "0") == "1"
+BINARY_INDEX_FILE = "index.binary"
+BINARY_VECTORS_FILE = "vectors.npy"
+# Shortlist size per requested result for two-stage retrieval
+BINARY_CANDIDATE_FACTOR = 10
+# Indexes are memory-mapped read-only, so worker processes share one copy
+# in the page cache instead of each holding its own
+INDEX_READ_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+
+def index_factory_string(n_vectors: int, dim: int, quantization: str = "pq") -> str:
+    """
+    Pick a Faiss index layout for n_vectors embeddings of size dim.
+
+    Large stores get IVF with an HNSW coarse quantizer, so queries only
+    visit nprobe of the inverted lists, and vectors encoded as chosen by
+    quantization ("pq" adds an OPQ rotation). Small stores search every
+    vector: exactly, or over scalar-quantized codes for "fp16"/"int8".
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"quantization must be one of {QUANTIZATION_MODES}, got {quantization!r}")
+
+    small = n_vectors < FLAT_INDEX_MAX
+    if quantization == "pq" and (small or dim % PQ_SUBQUANTIZERS):
+        return "Flat"
+    if small:
+        return SQ_ENCODINGS[quantization]
+
+    # ~4*sqrt(N) lists, rounded to a power of two, with at least 39 training
+    # points per list as Faiss recommends. Training sees at most
+    # TRAIN_SAMPLE_MAX vectors, so that is what bounds the list count
+    nlist = 1 << int(np.log2(4 * np.sqrt(n_vectors)))
+    nlist = max(256, min(nlist, IVF_MAX_LISTS, min(n_vectors, TRAIN_SAMPLE_MAX) // 39))
+    if quantization == "pq":
+        m = PQ_SUBQUANTIZERS
+        return f"OPQ{m},IVF{nlist}_HNSW32,PQ{m}x8"
+    return f"IVF{nlist}_HNSW32,{SQ_ENCODINGS[quantization]}"
+
+
+def set_nprobe(index, nprobe: int, quantizer_ef_search: int = DEFAULT_QUANTIZER_EF_SEARCH,
+               polysemous_ht: int = DEFAULT_POLYSEMOUS_HT):
+    """
+    Set IVF search parameters on an index (also when wrapped, e.g. by OPQ):
+    nprobe, the HNSW coarse quantizer's efSearch and, for IVFPQ, the
+    polysemous threshold. No-op on non-IVF indexes.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return
+    ivf.nprobe = nprobe
+    quantizer = faiss.downcast_index(ivf.quantizer)
+    if isinstance(quantizer, faiss.IndexHNSW):
+        quantizer.hnsw.efSearch = quantizer_ef_search
+    ivf = faiss.downcast_index(ivf)
+    if isinstance(ivf, faiss.IndexIVFPQ):
+        ivf.polysemous_ht = polysemous_ht
+
+
+class BatchedHuggingFaceEmbeddings(HuggingFaceEmbeddings):
+    """HuggingFaceEmbeddings that encodes in large batches without autograd"""
+
+    def embed_matrix(self, texts) -> np.ndarray:
+        """Embed texts as one normalized float32 matrix"""
+        with torch.inference_mode():
+            vectors = self.client.encode(
+                list(texts),
+                batch_size=EMBED_BATCH_SIZE,
+                convert_to_tensor=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+        # numpy has no bfloat16; upcast before leaving torch
+        return vectors.float().cpu().numpy()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_matrix([text])[0].tolist()
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    EMBEDDING_MODEL exported to ONNX and run with onnxruntime, pooled like
+    sentence-transformers does it: mean over the attention mask, then L2
+    normalization
+    """
+
+    def __init__(self, model_path: str, max_length: int = 256):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{EMBEDDING_MODEL}")
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.max_length = max_length
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def embed_matrix(self, texts) -> np.ndarray:
+        """Embed texts as one normalized float32 matrix"""
+        texts = list(texts)
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            tokens = self.tokenizer(
+                texts[start:start + EMBED_BATCH_SIZE],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            hidden = self.session.run(None, {name: tokens[name].astype(np.int64) for name in self.input_names})[0]
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            vectors[start:start + len(pooled)] = pooled
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_matrix([text])[0].tolist()
+
+
+def binarize(vectors):
+    """Sign-threshold float vectors and pack them 8 dims per byte"""
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+
+class BinaryRerankRetriever(BaseRetriever):
+    """
+    Two-stage retriever: a Hamming search over binary codes shortlists
+    k * candidate_factor chunks, which are then re-scored against their
+    exact float32 vectors (memory-mapped).
+
+    The main Faiss index is never searched, so nprobe, the coarse quantizer's
+    efSearch and polysemous_ht have no effect here, and the shortlist scans
+    every binary code.
+    """
+    vectorstore: Any
+    binary_index: Any
+    vectors: Any
+    k: int = 3
+    candidate_factor: int = BINARY_CANDIDATE_FACTOR
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_vector = self.vectorstore.embedding_function.embed_query(query)
+        return self.documents_for_vector(query_vector)
+
+    def documents_for_vector(self, query_vector) -> List[Document]:
+        """The k best chunks for an already embedded (normalized) query"""
+        db = self.vectorstore
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+
+        _, candidates = self.binary_index.search(binarize(query_vector)[None, :], self.k * self.candidate_factor)
+        # Ascending ids read the memory-mapped vectors front to back
+        candidates = np.sort(candidates[0][candidates[0] >= 0])
+        if len(candidates) == 0:
+            return []
+
+        scores = self.vectors[candidates] @ query_vector
+        best = candidates[np.argsort(-scores)[:self.k]]
+        return [db.docstore.search(db.index_to_docstore_id[int(i)]) for i in best]
+
+
 class VectorStoreBuilder:
-    def __init__(self, csv_path: str, persist_dir: str = "chroma_db"):
+    def __init__(self, csv_path: str, persist_dir: str = "faiss_index", quantization: str = "pq",
+                 quantizer_ef_search: int = DEFAULT_QUANTIZER_EF_SEARCH,
+                 polysemous_ht: int = DEFAULT_POLYSEMOUS_HT, two_stage: bool = TWO_STAGE_RETRIEVAL):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"quantization must be one of {QUANTIZATION_MODES}, got {quantization!r}")
         self.csv_path = csv_path
         self.persist_dir = persist_dir
+        self.quantization = quantization
+        # Search-time IVF tuning, applied whenever the index is loaded
+        self.quantizer_ef_search = quantizer_ef_search
+        self.polysemous_ht = polysemous_ht
+        # Build (and serve) the binary shortlist and exact vectors as well
+        self.two_stage = two_stage
+        # Lives beside persist_dir so clearing the store for a rebuild keeps it
+        self.embedding_cache = persist_dir.rstrip("/\\") + "_embeddings.npz"
+        # Fingerprint of the CSV the store was built from
+        self.fingerprint_file = os.path.join(persist_dir, "data.fingerprint")
         
         # Verify CSV file exists
         if not os.path.exists(self.csv_path):
             raise FileNotFoundError(f"CSV file not found: {self.csv_path}")
             
-        # Initialize embeddings
+        # Initialize embeddings. Normalized vectors make inner product equal
+        # to cosine similarity, which is what the index ranks by
         print("Initializing embeddings model...")
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': False}
-        )
+        if EMBEDDING_BACKEND == "onnx":
+            self.embeddings = OnnxEmbeddings(EMBEDDING_ONNX_PATH)
+            self.embedding_dim = self.embeddings.dimension
+        else:
+            self.embeddings = BatchedHuggingFaceEmbeddings(
+                model_name=EMBEDDING_MODEL,
+                model_kwargs={'device': 'cpu'},
+                encode_kwargs={'normalize_embeddings': True}
+            )
+            self.embeddings.client.to(dtype=getattr(torch, EMBEDDING_DTYPE))
+            self.embedding_dim = self.embeddings.client.get_sentence_embedding_dimension()
         print("Embeddings model initialized successfully")
     
     def clear_existing_db(self):
@@ -44,62 +296,57 @@ class VectorStoreBuilder:
         Args:
             force_rebuild: If True, rebuild even if vector store exists
         """
+        fingerprint = compute_fingerprint(self.csv_path, VECTOR_SCHEMA_VERSION)
+        # A store built with another encoding doesn't count as up to date
+        fingerprint['quantization'] = self.quantization
+        fingerprint['embedding'] = EMBEDDING_VARIANT
+        if self.two_stage:
+            # A store built without the two-stage files is rebuilt to add them
+            fingerprint['two_stage'] = True
+
         # Check if vector store already exists
         if os.path.exists(self.persist_dir) and not force_rebuild:
-            print(f"Vector store already exists at {self.persist_dir}")
-            try:
-                return self.load_vector_store()
-            except Exception as e:
-                print(f"Failed to load existing vector store: {e}")
+            stored = read_fingerprint(self.fingerprint_file)
+            if stored is not None and stored != fingerprint:
+                print(f"{self.csv_path} changed since the vector store was built")
                 print("Rebuilding vector store...")
                 self.clear_existing_db()
+            else:
+                print(f"Vector store already exists at {self.persist_dir}")
+                try:
+                    return self.load_vector_store()
+                except Exception as e:
+                    print(f"Failed to load existing vector store: {e}")
+                    print("Rebuilding vector store...")
+                    self.clear_existing_db()
         
         try:
-            # Load CSV data
-            print(f"Loading CSV from: {self.csv_path}")
-            loader = CSVLoader(
-                file_path=self.csv_path,
-                encoding='utf-8',
-                csv_args={
-                    'delimiter': ',',
-                    'quotechar': '"',
-                    'fieldnames': None  # Let it auto-detect field names
-                }
-            )
-            
-            data = loader.load()
-            print(f"Loaded {len(data)} documents from CSV")
+            # Rows are read and split one at a time; only the chunks are kept
+            print(f"Loading and splitting CSV from: {self.csv_path}")
+            texts = list(self._iter_chunks())
+            print(f"Created {len(texts)} text chunks")
             
-            if len(data) == 0:
+            if len(texts) == 0:
                 raise ValueError("No data loaded from CSV file")
             
-            # Split documents
-            print("Splitting documents...")
-            splitter = CharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=100,
-                separator="\n",
-                length_function=len
-            )
-            texts = splitter.split_documents(data)
-            print(f"Created {len(texts)} text chunks")
-            
-            # Create and persist vector store
+            # Embed block by block straight into the indexes
+            print("Embedding text chunks...")
+            index, binary_index = self._build_indexes([doc.page_content for doc in texts])
+
             print("Creating vector store...")
-            # IMPORTANT: Use 'embedding' parameter for creation
-            db = Chroma.from_documents(
-                documents=texts,
-                embedding=self.embeddings,  # Note: 'embedding' not 'embeddings'
-                persist_directory=self.persist_dir,
-                collection_name="medical_recommendations"
+            db = FAISS(
+                embedding_function=self.embeddings,
+                index=index,
+                docstore=InMemoryDocstore({str(i): doc for i, doc in enumerate(texts)}),
+                index_to_docstore_id={i: str(i) for i in range(len(texts))},
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
             )
             
-            # Explicitly persist (may not be needed in newer versions)
-            try:
-                db.persist()
-            except AttributeError:
-                # persist() method might not exist in newer versions
-                pass
+            # Writes index.faiss (faiss.write_index) and the docstore pickle
+            db.save_local(self.persist_dir)
+            if binary_index is not None:
+                faiss.write_index_binary(binary_index, os.path.join(self.persist_dir, BINARY_INDEX_FILE))
+            write_fingerprint(self.fingerprint_file, fingerprint)
             
             print(f"Vector store saved to {self.persist_dir}")
             return db
@@ -108,35 +355,144 @@ class VectorStoreBuilder:
             print(f"Error building vector store: {e}")
             raise
     
+    def _iter_chunks(self):
+        """
+        Yield one document per CSV row, read one row at a time instead of
+        loading every row first; the rare row over ROW_CHUNK_SIZE is split
+        """
+        loader = CSVLoader(
+            file_path=self.csv_path,
+            encoding='utf-8',
+            csv_args={
+                'delimiter': ',',
+                'quotechar': '"',
+                'fieldnames': None  # Let it auto-detect field names
+            }
+        )
+        splitter = CharacterTextSplitter(
+            chunk_size=ROW_CHUNK_SIZE,
+            chunk_overlap=100,
+            separator="\n",
+            length_function=len
+        )
+        for row in loader.lazy_load():
+            if len(row.page_content) > ROW_CHUNK_SIZE:
+                yield from splitter.split_documents([row])
+            else:
+                yield row
+
+    def _build_indexes(self, texts):
+        """
+        Embed texts EMBED_BLOCK_SIZE at a time and add each block to the main
+        index. With two_stage, each block also goes to a binary copy (48 bytes
+        per vector for 384 dims) and to the exact vectors in
+        persist_dir/BINARY_VECTORS_FILE; otherwise the binary index returned
+        is None. Vectors cached by a previous build, keyed by the sha1 of the
+        text, are reused instead of re-embedded.
+
+        The embedding cache keeps every distinct vector in memory as float32
+        (1.5 KB each for 384 dims), and writing it back stacks them into one
+        more matrix of that size, so peak memory is about twice
+        distinct texts x dim x 4 bytes on top of the index being built.
+        """
+        # Vectors from another model, dtype or backend aren't interchangeable
+        cache_model = EMBEDDING_VARIANT
+        keys = np.array([hashlib.sha1(text.encode("utf-8")).digest() for text in texts], dtype="S20").tolist()
+
+        cached = {}
+        if os.path.exists(self.embedding_cache):
+            with np.load(self.embedding_cache) as cache:
+                if str(cache["model"]) == cache_model:
+                    cached = dict(zip(cache["keys"].tolist(), cache["vectors"]))
+
+        distinct = dict.fromkeys(keys)
+        missing = sum(key not in cached for key in distinct)
+        print(f"Reusing {len(distinct) - missing} cached embeddings, computing {missing}")
+
+        n_vectors = len(texts)
+        dim = self.embedding_dim
+        spec = index_factory_string(n_vectors, dim, self.quantization)
+        print(f"Building Faiss index '{spec}' over {n_vectors} vectors")
+
+        index = faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            # Embedded sample vectors land in the cache, so nothing is embedded twice
+            rows = range(n_vectors)
+            if n_vectors > TRAIN_SAMPLE_MAX:
+                rows = np.sort(np.random.default_rng(0).choice(n_vectors, TRAIN_SAMPLE_MAX, replace=False))
+            index.train(self._embed_block([texts[i] for i in rows], [keys[i] for i in rows], cached))
+
+        binary_index = vectors = None
+        if self.two_stage:
+            binary_index = faiss.IndexBinaryFlat(dim)
+            os.makedirs(self.persist_dir, exist_ok=True)
+            vectors = np.lib.format.open_memmap(
+                os.path.join(self.persist_dir, BINARY_VECTORS_FILE), mode="w+", dtype=np.float32, shape=(n_vectors, dim)
+            )
+        for start in range(0, n_vectors, EMBED_BLOCK_SIZE):
+            stop = start + EMBED_BLOCK_SIZE
+            block = self._embed_block(texts[start:stop], keys[start:stop], cached)
+            index.add(block)
+            if self.two_stage:
+                binary_index.add(binarize(block))
+                vectors[start:stop] = block
+        if vectors is not None:
+            vectors.flush()
+            del vectors
+        set_nprobe(index, DEFAULT_NPROBE, self.quantizer_ef_search, self.polysemous_ht)
+
+        # Only keep the current texts so the cache doesn't grow across edits
+        if missing or len(cached) != len(distinct):
+            np.savez_compressed(
+                self.embedding_cache,
+                model=cache_model,
+                keys=np.array(list(distinct), dtype="S20"),
+                vectors=np.vstack([cached[key] for key in distinct])
+            )
+        return index, binary_index
+
+    def _embed_block(self, texts, keys, cached):
+        """
+        C-contiguous float32 matrix for texts, the layout Faiss takes without
+        converting, embedding (and caching) only uncached ones
+        """
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            cached.update(zip(missing, self.embeddings.embed_matrix(list(missing.values()))))
+
+        block = np.empty((len(keys), len(cached[keys[0]])), dtype=np.float32)
+        for row, key in enumerate(keys):
+            block[row] = cached[key]
+        return block
+
     def load_vector_store(self):
         """Load existing vector store"""
-        if not os.path.exists(self.persist_dir):
+        if not os.path.exists(os.path.join(self.persist_dir, "index.faiss")):
             raise FileNotFoundError(f"No vector store found at {self.persist_dir}")
         
         try:
             print(f"Loading vector store from {self.persist_dir}")
-            # IMPORTANT: Use 'embedding_function' parameter for loading
-            db = Chroma(
-                persist_directory=self.persist_dir,
-                embedding_function=self.embeddings,  # Note: 'embedding_function' not 'embeddings'
-                collection_name="medical_recommendations"
+            # Same as FAISS.load_local, but with the index memory-mapped.
+            # The docstore is a pickle this builder wrote itself
+            index = faiss.read_index(os.path.join(self.persist_dir, "index.faiss"), INDEX_READ_FLAGS)
+            with open(os.path.join(self.persist_dir, "index.pkl"), "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            db = FAISS(
+                embedding_function=self.embeddings,
+                index=index,
+                docstore=docstore,
+                index_to_docstore_id=index_to_docstore_id,
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
             )
+            set_nprobe(db.index, DEFAULT_NPROBE, self.quantizer_ef_search, self.polysemous_ht)
             print("Vector store loaded successfully")
             return db
         except Exception as e:
             print(f"Error loading vector store: {e}")
-            # Try alternative parameter name if the above fails
-            try:
-                db = Chroma(
-                    persist_directory=self.persist_dir,
-                    embedding=self.embeddings,  # Try 'embedding' instead
-                    collection_name="medical_recommendations"
-                )
-                print("Vector store loaded successfully (using 'embedding' parameter)")
-                return db
-            except Exception as e2:
-                print(f"Error with alternative loading approach: {e2}")
-                raise e  # Raise the original error
+            raise
     
     def test_vector_store(self, query: str = "test", k: int = 3):
         """Test the vector store with a sample query"""
@@ -149,23 +505,62 @@ class VectorStoreBuilder:
             print(f"Error testing vector store: {e}")
             return None
     
-    def get_retriever(self, search_kwargs: dict = None):
-        """Get a retriever from the vector store"""
-        if search_kwargs is None:
-            search_kwargs = {"k": 3}
-        
+    def get_retriever(self, search_kwargs: dict = None, two_stage: bool = None):
+        """
+        Get a retriever from the vector store. search_kwargs may include
+        "nprobe" to trade recall for speed on IVF indexes.
+
+        two_stage (default: the builder's, from TWO_STAGE_RETRIEVAL) serves a
+        BinaryRerankRetriever instead when the store was built with its
+        binary index and exact vectors; it ignores nprobe and the other IVF
+        search settings.
+        """
+        search_kwargs = dict(search_kwargs or {"k": 3})
+        nprobe = search_kwargs.pop("nprobe", DEFAULT_NPROBE)
+        if two_stage is None:
+            two_stage = self.two_stage
+
         db = self.load_vector_store()
+        if not isinstance(db, FAISS):
+            # Legacy Chroma store (VectorStoreBuilderCompat): no index to tune
+            return db.as_retriever(search_kwargs=search_kwargs)
+        set_nprobe(db.index, nprobe, self.quantizer_ef_search, self.polysemous_ht)
+
+        binary_path = os.path.join(self.persist_dir, BINARY_INDEX_FILE)
+        vectors_path = os.path.join(self.persist_dir, BINARY_VECTORS_FILE)
+        if two_stage and os.path.exists(binary_path) and os.path.exists(vectors_path):
+            return BinaryRerankRetriever(
+                vectorstore=db,
+                binary_index=faiss.read_index_binary(binary_path, INDEX_READ_FLAGS),
+                # Memory-mapped like the indexes, so workers share the pages
+                vectors=np.load(vectors_path, mmap_mode="r"),
+                k=search_kwargs.get("k", 3)
+            )
         return db.as_retriever(search_kwargs=search_kwargs)
 
 
 # Backward compatibility wrapper
 class VectorStoreBuilderCompat(VectorStoreBuilder):
-    """Compatibility wrapper that handles both old and new parameter names"""
+    """
+    Compatibility wrapper that falls back to a Chroma store built by older
+    versions when no Faiss index has been built yet
+    """
+
+    def __init__(self, csv_path: str, persist_dir: str = "faiss_index", quantization: str = "pq",
+                 legacy_chroma_dir: str = "chroma_db", **search_params):
+        super().__init__(csv_path, persist_dir, quantization, **search_params)
+        self.legacy_chroma_dir = legacy_chroma_dir
     
     def load_vector_store(self):
-        """Load with automatic parameter detection"""
-        if not os.path.exists(self.persist_dir):
+        """Load the Faiss index, or the legacy Chroma store if that is all there is"""
+        if os.path.exists(os.path.join(self.persist_dir, "index.faiss")):
+            return super().load_vector_store()
+
+        if not os.path.exists(os.path.join(self.legacy_chroma_dir, "chroma.sqlite3")):
             raise FileNotFoundError(f"No vector store found at {self.persist_dir}")
+
+        from langchain_chroma import Chroma
+        print(f"No Faiss index yet, loading legacy Chroma store from {self.legacy_chroma_dir}")
         
         # Try different parameter combinations
         param_combinations = [
@@ -179,7 +574,7 @@ class VectorStoreBuilderCompat(VectorStoreBuilder):
             try:
                 print(f"Trying to load with parameters: {list(params.keys())}")
                 db = Chroma(
-                    persist_directory=self.persist_dir,
+                    persist_directory=self.legacy_chroma_dir,
                     collection_name="medical_recommendations",
                     **params
                 )
@@ -210,7 +605,7 @@ if __name__ == "__main__":
         # Use compatibility wrapper for better version handling
         builder = VectorStoreBuilderCompat(
             csv_path=csv_path,
-            persist_dir='/tmp/chroma_db'  # Use /tmp for GCP Cloud Run
+            persist_dir='/tmp/faiss_index'  # Use /tmp for GCP Cloud Run
         )
         
         # Force rebuild to ensure clean state
@@ -224,4 +619,3 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Failed to initialize vector store: {e}")
         sys.exit(1)
-
@@ -12,7 +12,7 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from flask import Flask, render_template, request, jsonify
+    from flask import Flask, current_app, render_template, request, jsonify
     from flask_cors import CORS
     from pipeline.pipeline import MedRecommendationPipeline
     from dotenv import load_dotenv
@@ -39,12 +39,24 @@ CORS(app)
 # Global pipeline instance
 pipeline = None
 
+# Wraps every recommendation returned by /api/search
+ENHANCED_TEMPLATE = (
+    "**AI-POWERED MEDICAL RECOMMENDATION**\n\n"
+    "**Query Processed:** {query}\n\n"
+    "**Database:** 4+ Lakh Medicines Analyzed\n\n"
+    "{recommendation}\n\n"
+    "---\n"
+    "*Powered by Advanced AI • Real-time Analysis • Comprehensive Database*"
+)
+
 def init_pipeline():
     """Initialize the medical recommendation pipeline"""
     global pipeline
     try:
         logger.info("🔄 Initializing Medical Recommendation Pipeline...")
         pipeline = MedRecommendationPipeline()
+        # Bound once so requests skip the global and attribute lookups
+        app.config['RECOMMEND'] = pipeline.recommend
         logger.info("✅ Pipeline initialized successfully!")
         return True
     except Exception as e:
@@ -69,7 +81,8 @@ def search_medicines():
                 'error': 'Please provide a search query'
             }), 400
 
-        if pipeline is None:
+        recommend = current_app.config.get('RECOMMEND')
+        if recommend is None:
             return jsonify({
                 'success': False,
                 'error': 'Medical recommendation system is not initialized'
@@ -77,21 +90,10 @@ def search_medicines():
 
         # Get recommendations from your existing pipeline
         logger.info(f"🔍 Processing query: {query}")
-        recommendation = pipeline.recommend(query)
+        recommendation = recommend(query)
         
         # Enhance the response with additional metadata
-        enhanced_recommendation = f"""
-**AI-POWERED MEDICAL RECOMMENDATION**
-
-**Query Processed:** {query}
-
-**Database:** 4+ Lakh Medicines Analyzed
-
-{recommendation}
-
----
-*Powered by Advanced AI • Real-time Analysis • Comprehensive Database*
-        """.strip()
+        enhanced_recommendation = ENHANCED_TEMPLATE.format(query=query, recommendation=recommendation).strip()
         
         return jsonify({
             'success': True,
@@ -135,6 +137,19 @@ def find_available_port(start_port=5000, max_attempts=10):
     
     return None
 
+# gunicorn imports this module instead of running it:
+#   gunicorn -c gunicorn_conf.py start_app:app
+# With gevent workers the blocking Groq calls of many concurrent searches
+# overlap in one process. gunicorn_conf.py preloads the app, so this runs
+# once in the master and workers inherit the pipeline through fork
+if "gunicorn" in os.environ.get("SERVER_SOFTWARE", ""):
+    if not init_pipeline():
+        raise RuntimeError("Failed to initialize pipeline")
+    # Keep torch weights in shared memory so forked workers never copy them
+    model = getattr(pipeline.recommender.embeddings, "client", None)
+    if hasattr(model, "share_memory"):
+        model.share_memory()
+
 if __name__ == '__main__':
     print("🚀 Starting TheraSwitchRx | by MedQ AI...")
     print("=" * 60)
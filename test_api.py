@@ -1,17 +1,28 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Blueprint, Flask, render_template, request, jsonify
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from api_auth import require_api_key, api_manager
+from api_auth import authenticate_request, api_manager
+from utils.json_provider import ORJSONProvider, static_json, static_response
+from utils.log_queue import start_queue_logging
+from utils.request_id import fast_uuid4
 from dotenv import load_dotenv
 import logging
+import re
 from datetime import datetime
-import uuid
+from functools import lru_cache
+import orjson
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging. Request threads only enqueue records; a listener
+# thread does the actual (batched) writing to stderr, once per
+# TEST_API_LOG_FLUSH_SIZE bytes or TEST_API_LOG_FLUSH_MS milliseconds
+LOG_FLUSH_SIZE = int(os.environ.get('TEST_API_LOG_FLUSH_SIZE', str(16 * 1024)))
+LOG_FLUSH_MS = int(os.environ.get('TEST_API_LOG_FLUSH_MS', '50'))
+
+_log_listener = start_queue_logging(buffer_size=LOG_FLUSH_SIZE, flush_interval=LOG_FLUSH_MS / 1000)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -19,31 +30,125 @@ load_dotenv()
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
-def mock_search_medicine_alternatives(query):
-    """Mock function to simulate medicine search without full pipeline"""
-    return f"""
-**TheraSwitchRx AI RECOMMENDATION**
+# Constant response bodies, serialized once
+HEALTH_RESPONSE = static_json({
+    "success": True,
+    "data": {
+        "status": "healthy",
+        "version": "1.0.0",
+        "pipeline_initialized": True,
+        "total_medicines": "6+ lakh",
+        "uptime": "Active",
+        "features": [
+            "Medicine alternatives",
+            "AI-powered recommendations", 
+            "Real-time processing",
+            "Comprehensive database"
+        ]
+    },
+    "message": "TheraSwitchRx API is running"
+})
+
+MISSING_QUERY_RESPONSE = static_json({
+    "success": False,
+    "error": "Query parameter is required",
+    "code": "MISSING_QUERY"
+}, 400)
+
+EMPTY_QUERY_RESPONSE = static_json({
+    "success": False,
+    "error": "Query cannot be empty",
+    "code": "EMPTY_QUERY"
+}, 400)
+
+INTERNAL_ERROR_RESPONSE = static_json({
+    "success": False,
+    "error": "Internal server error",
+    "code": "INTERNAL_ERROR"
+}, 500)
+
+MEDICINE_INFO_ERROR_RESPONSE = static_json({
+    "success": False,
+    "error": "Failed to retrieve medicine information",
+    "code": "MEDICINE_INFO_ERROR"
+}, 500)
+
+MISSING_DATA_RESPONSE = static_json({
+    "success": False,
+    "error": "Request body is required",
+    "code": "MISSING_DATA"
+}, 400)
+
+MISSING_CREDENTIALS_RESPONSE = static_json({
+    "success": False,
+    "error": "Email and name are required",
+    "code": "MISSING_CREDENTIALS"
+}, 400)
 
-**Query:** {query}
-**Database:** 6+ Lakh Medicines Analyzed
-**Analysis:** Real-time AI Processing
+INVALID_EMAIL_RESPONSE = static_json({
+    "success": False,
+    "error": "Invalid email format",
+    "code": "INVALID_EMAIL"
+}, 400)
 
-Based on your query "{query}", here are the recommended alternatives:
+INVALID_PLAN_RESPONSE = static_json({
+    "success": False,
+    "error": "Invalid plan type. Choose from: free, basic, pro, enterprise",
+    "code": "INVALID_PLAN"
+}, 400)
 
-1. **Generic Alternative 1** - Same salt composition, cost-effective
-2. **Generic Alternative 2** - Similar therapeutic effect
-3. **Brand Alternative** - Trusted manufacturer option
+SEARCH_ERROR_RESPONSE = static_json({
+    "success": False,
+    "error": "An error occurred while processing your request"
+}, 500)
 
-**Important Notes:**
-- Always consult your doctor before switching medicines
-- Check for allergies and contraindications
-- Verify dosage with healthcare provider
+GENERATION_FAILED_RESPONSE = static_json({
+    "success": False,
+    "error": "Failed to generate API key. Email might already be registered.",
+    "code": "GENERATION_FAILED"
+}, 400)
 
----
-*Powered by Advanced AI • Comprehensive Medical Database • Instant Results*
-    """.strip()
+# Fields of a key request, with their defaults, and the plans it may ask for
+_KEY_REQUEST_FIELDS = (('email', ''), ('name', ''), ('plan', 'free'))
+_VALID_PLANS = frozenset(('free', 'basic', 'pro', 'enterprise'))
+# One '@', no whitespace, and a dot in the domain part
+_EMAIL_RE = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+def _clean_field(data, field, default=''):
+    """data[field] without surrounding whitespace; default if absent, '' if empty or null"""
+    value = data.get(field, default)
+    if not value:
+        return ''
+    # strip() hands back the same object when there is nothing to trim
+    return value.strip()
+
+# Constant parts of the mock recommendation around the two query slots
+_MOCK_HEADER = "**TheraSwitchRx AI RECOMMENDATION**\n\n**Query:** "
+_MOCK_MIDDLE = (
+    "\n**Database:** 6+ Lakh Medicines Analyzed\n"
+    "**Analysis:** Real-time AI Processing\n\n"
+    "Based on your query \""
+)
+_MOCK_FOOTER = (
+    "\", here are the recommended alternatives:\n\n"
+    "1. **Generic Alternative 1** - Same salt composition, cost-effective\n"
+    "2. **Generic Alternative 2** - Similar therapeutic effect\n"
+    "3. **Brand Alternative** - Trusted manufacturer option\n\n"
+    "**Important Notes:**\n"
+    "- Always consult your doctor before switching medicines\n"
+    "- Check for allergies and contraindications\n"
+    "- Verify dosage with healthcare provider\n\n"
+    "---\n"
+    "*Powered by Advanced AI • Comprehensive Medical Database • Instant Results*"
+)
+
+@lru_cache(maxsize=4096)
+def mock_search_medicine_alternatives(query):
+    """Mock function to simulate medicine search without full pipeline"""
+    return "".join([_MOCK_HEADER, query, _MOCK_MIDDLE, query, _MOCK_FOOTER])
 
 @app.route('/')
 def index():
@@ -62,173 +167,183 @@ def api_documentation():
 
 # ========== API v1 ENDPOINTS (WITH AUTHENTICATION) ==========
 
-@app.route('/api/v1/search', methods=['POST'])
-@require_api_key
+v1 = Blueprint('v1', __name__, url_prefix='/api/v1')
+
+# v1 endpoints that don't take an API key
+PUBLIC_V1_ENDPOINTS = frozenset({'v1.create_api_key', 'v1.api_v1_health'})
+
+@v1.before_request
+def authenticate_v1():
+    """Check the API key once, before any authenticated v1 view runs"""
+    if request.endpoint in PUBLIC_V1_ENDPOINTS:
+        return None
+    return authenticate_request()
+
+@v1.route('/search', methods=['POST'])
 def api_v1_search():
     """
     Enhanced API endpoint for medicine search (requires API key)
     Headers: X-API-Key: your_api_key_here
     Body: {"query": "medicine name or condition"}
     """
-    try:
-        data = request.get_json()
-        
-        if not data or 'query' not in data:
-            return jsonify({
-                "success": False,
-                "error": "Query parameter is required",
-                "code": "MISSING_QUERY"
-            }), 400
-        
-        query = data['query'].strip()
-        if not query:
-            return jsonify({
-                "success": False,
-                "error": "Query cannot be empty",
-                "code": "EMPTY_QUERY"
-            }), 400
-
-        # Use mock function for testing
-        logger.info(f"API v1 request from {request.api_user['user_email']}: {query}")
-        recommendation = mock_search_medicine_alternatives(query)
-        
-        return jsonify({
-            "success": True,
-            "data": {
-                "query": query,
-                "recommendation": recommendation,
-                "metadata": {
-                    "timestamp": datetime.now().isoformat(),
-                    "request_id": str(uuid.uuid4()),
-                    "database_size": "6+ Lakh medicines",
-                    "processing_type": "AI-powered analysis",
-                    "response_time": "< 2 seconds"
-                }
-            },
-            "message": "Recommendations generated successfully",
-            "api_usage": {
-                "requests_remaining": request.api_user["requests_remaining"],
-                "plan": request.api_user["plan"],
-                "user": request.api_user["user_email"]
+    api_user = request.api_user
+    data = request.get_json(silent=True, cache=False)
+    
+    if not data or 'query' not in data:
+        return static_response(MISSING_QUERY_RESPONSE)
+    
+    query = _clean_field(data, 'query')
+    if not query:
+        return static_response(EMPTY_QUERY_RESPONSE)
+
+    # Use mock function for testing
+    logger.info("API v1 request from %s: %s", api_user['user_email'], query)
+    recommendation = mock_search_medicine_alternatives(query)
+    
+    return jsonify({
+        "success": True,
+        "data": {
+            "query": query,
+            "recommendation": recommendation,
+            "metadata": {
+                "timestamp": datetime.now(),
+                "request_id": fast_uuid4(),
+                "database_size": "6+ Lakh medicines",
+                "processing_type": "AI-powered analysis",
+                "response_time": "< 2 seconds"
             }
-        })
-        
-    except Exception as e:
-        logger.error(f"API v1 search error: {str(e)}")
-        return jsonify({
-            "success": False,
-            "error": "Internal server error",
-            "code": "INTERNAL_ERROR"
-        }), 500
+        },
+        "message": "Recommendations generated successfully",
+        "api_usage": {
+            "requests_remaining": api_user["requests_remaining"],
+            "plan": api_user["plan"],
+            "user": api_user["user_email"]
+        }
+    })
+
+# Size of each delta line when streaming the mock recommendation
+STREAM_CHUNK_SIZE = 200
+
+@v1.route('/search/stream', methods=['POST'])
+def api_v1_search_stream():
+    """
+    Streaming variant of /api/v1/search (requires API key)
+    Headers: X-API-Key: your_api_key_here
+    Body: {"query": "medicine name or condition"}
+    Response: newline-delimited JSON, one "meta" line, then "delta" lines
+    with pieces of the recommendation, then a "done" line
+    """
+    api_user = request.api_user
+    data = request.get_json(silent=True, cache=False)
+
+    if not data or 'query' not in data:
+        return static_response(MISSING_QUERY_RESPONSE)
+
+    query = _clean_field(data, 'query')
+    if not query:
+        return static_response(EMPTY_QUERY_RESPONSE)
+
+    logger.info("API v1 stream request from %s: %s", api_user['user_email'], query)
+    # Build everything the generator needs now; it runs after the request context is gone
+    api_usage = {
+        "requests_remaining": api_user["requests_remaining"],
+        "plan": api_user["plan"],
+        "user": api_user["user_email"]
+    }
+
+    def generate():
+        yield orjson.dumps({
+            "type": "meta",
+            "query": query,
+            "timestamp": datetime.now(),
+            "request_id": fast_uuid4()
+        }) + b"\n"
+        try:
+            # Mock path: slice the canned text so clients see the same
+            # framing a token stream from the LLM would produce
+            recommendation = mock_search_medicine_alternatives(query)
+            for start in range(0, len(recommendation), STREAM_CHUNK_SIZE):
+                yield orjson.dumps({
+                    "type": "delta",
+                    "t": recommendation[start:start + STREAM_CHUNK_SIZE]
+                }) + b"\n"
+        except Exception as e:
+            # Headers are already sent; report the failure in-band
+            logger.error("API v1 stream error: %s", e)
+            yield orjson.dumps({"type": "error", "code": "INTERNAL_ERROR"}) + b"\n"
+            return
+        yield orjson.dumps({"type": "done", "api_usage": api_usage}) + b"\n"
 
-@app.route('/api/v1/medicine/<medicine_name>', methods=['GET'])
-@require_api_key
+    return app.response_class(generate(), mimetype='application/x-ndjson', direct_passthrough=True)
+
+@v1.route('/medicine/<medicine_name>', methods=['GET'])
 def get_medicine_info(medicine_name):
     """Get detailed information about a specific medicine"""
-    try:
-        query = f"detailed information about {medicine_name}"
-        medicine_info = mock_search_medicine_alternatives(query)
-        
-        return jsonify({
-            "success": True,
-            "data": {
-                "medicine_name": medicine_name,
-                "information": medicine_info,
-                "timestamp": datetime.now().isoformat()
-            },
-            "message": f"Information for {medicine_name} retrieved successfully",
-            "api_usage": {
-                "requests_remaining": request.api_user["requests_remaining"],
-                "plan": request.api_user["plan"]
-            }
-        })
-        
-    except Exception as e:
-        logger.error(f"Medicine info error: {str(e)}")
-        return jsonify({
-            "success": False,
-            "error": "Failed to retrieve medicine information",
-            "code": "MEDICINE_INFO_ERROR"
-        }), 500
+    api_user = request.api_user
+    query = f"detailed information about {medicine_name}"
+    medicine_info = mock_search_medicine_alternatives(query)
+    
+    return jsonify({
+        "success": True,
+        "data": {
+            "medicine_name": medicine_name,
+            "information": medicine_info,
+            "timestamp": datetime.now()
+        },
+        "message": f"Information for {medicine_name} retrieved successfully",
+        "api_usage": {
+            "requests_remaining": api_user["requests_remaining"],
+            "plan": api_user["plan"]
+        }
+    })
 
 # ========== API KEY MANAGEMENT ENDPOINTS ==========
 
-@app.route('/api/v1/get-api-key', methods=['POST'])
+@v1.route('/get-api-key', methods=['POST'])
 def create_api_key():
     """Generate a new API key"""
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "success": False,
-                "error": "Request body is required",
-                "code": "MISSING_DATA"
-            }), 400
-        
-        email = data.get('email', '').strip()
-        name = data.get('name', '').strip()
-        plan = data.get('plan', 'free').strip()
-        
-        if not email or not name:
-            return jsonify({
-                "success": False,
-                "error": "Email and name are required",
-                "code": "MISSING_CREDENTIALS"
-            }), 400
-        
-        # Basic email validation
-        if '@' not in email or '.' not in email:
-            return jsonify({
-                "success": False,
-                "error": "Invalid email format",
-                "code": "INVALID_EMAIL"
-            }), 400
-        
-        # Validate plan
-        if plan not in ['free', 'basic', 'pro', 'enterprise']:
-            return jsonify({
-                "success": False,
-                "error": "Invalid plan type. Choose from: free, basic, pro, enterprise",
-                "code": "INVALID_PLAN"
-            }), 400
-        
-        # Generate API key
-        result = api_manager.generate_api_key(email, name, plan)
-        
-        if not result:
-            return jsonify({
-                "success": False,
-                "error": "Failed to generate API key. Email might already be registered.",
-                "code": "GENERATION_FAILED"
-            }), 400
-        
-        logger.info(f"New API key generated for {email} ({plan} plan)")
-        
-        return jsonify({
-            "success": True,
-            "data": result,
-            "message": "API key generated successfully"
-        })
-        
-    except Exception as e:
-        logger.error(f"API key generation error: {str(e)}")
-        return jsonify({
-            "success": False,
-            "error": "Internal server error",
-            "code": "INTERNAL_ERROR"
-        }), 500
+    data = request.get_json(silent=True, cache=False)
+    
+    if not data:
+        return static_response(MISSING_DATA_RESPONSE)
+    
+    email, name, plan = [_clean_field(data, field, default) for field, default in _KEY_REQUEST_FIELDS]
+    
+    if not email or not name:
+        return static_response(MISSING_CREDENTIALS_RESPONSE)
+    
+    # Basic email validation
+    if not _EMAIL_RE.fullmatch(email):
+        return static_response(INVALID_EMAIL_RESPONSE)
+    
+    # Validate plan
+    if plan not in _VALID_PLANS:
+        return static_response(INVALID_PLAN_RESPONSE)
+    
+    # Generate API key
+    result = api_manager.generate_api_key(email, name, plan)
+    
+    if not result:
+        return static_response(GENERATION_FAILED_RESPONSE)
+    
+    logger.info("New API key generated for %s (%s plan)", email, plan)
+    
+    return jsonify({
+        "success": True,
+        "data": result,
+        "message": "API key generated successfully"
+    })
 
-@app.route('/api/v1/key-info', methods=['GET'])
-@require_api_key
+@v1.route('/key-info', methods=['GET'])
 def get_api_key_info():
     """Get information about your API key"""
+    api_user = request.api_user
     return jsonify({
         "success": True,
         "data": {
-            "email": request.api_user["user_email"],
-            "plan": request.api_user["plan"],
-            "requests_remaining": request.api_user["requests_remaining"],
+            "email": api_user["user_email"],
+            "plan": api_user["plan"],
+            "requests_remaining": api_user["requests_remaining"],
             "status": "active"
         },
         "message": "API key information retrieved successfully"
@@ -236,63 +351,58 @@ def get_api_key_info():
 
 # ========== PUBLIC ENDPOINTS (NO AUTHENTICATION) ==========
 
-@app.route('/api/v1/health', methods=['GET'])
+@v1.route('/health', methods=['GET'])
 def api_v1_health():
     """API Health check (public endpoint)"""
-    return jsonify({
-        "success": True,
-        "data": {
-            "status": "healthy",
-            "version": "1.0.0",
-            "pipeline_initialized": True,
-            "total_medicines": "6+ lakh",
-            "uptime": "Active",
-            "features": [
-                "Medicine alternatives",
-                "AI-powered recommendations", 
-                "Real-time processing",
-                "Comprehensive database"
-            ]
-        },
-        "message": "TheraSwitchRx API is running"
-    })
+    return static_response(HEALTH_RESPONSE)
+
+app.register_blueprint(v1)
 
 # ========== LEGACY ENDPOINT FOR WEB APP ==========
 
 @app.route('/api/search', methods=['POST'])
 def search_medicines():
     """Legacy API endpoint for the web interface"""
-    try:
-        data = request.get_json()
-        query = data.get('query', '').strip()
-        
-        if not query:
-            return jsonify({
-                'success': False,
-                'error': 'Please provide a search query'
-            }), 400
-
-        # Use mock function
-        logger.info(f"Web app query: {query}")
-        recommendation = mock_search_medicine_alternatives(query)
-        
-        return jsonify({
-            'success': True,
-            'query': query,
-            'recommendation': recommendation,
-            'metadata': {
-                'database_size': '6+ Lakh medicines',
-                'processing_type': 'AI-powered analysis',
-                'response_time': 'Real-time'
-            }
-        })
-
-    except Exception as e:
-        logger.error(f"Error processing search request: {e}")
+    data = request.get_json(silent=True, cache=False)
+    query = _clean_field(data, 'query') if data else ''
+    
+    if not query:
         return jsonify({
             'success': False,
-            'error': 'An error occurred while processing your request'
-        }), 500
+            'error': 'Please provide a search query'
+        }), 400
+
+    # Use mock function
+    logger.info("Web app query: %s", query)
+    recommendation = mock_search_medicine_alternatives(query)
+    
+    return jsonify({
+        'success': True,
+        'query': query,
+        'recommendation': recommendation,
+        'metadata': {
+            'database_size': '6+ Lakh medicines',
+            'processing_type': 'AI-powered analysis',
+            'response_time': 'Real-time'
+        }
+    })
+
+# ========== ERROR HANDLING ==========
+
+# Endpoints whose unexpected errors get a body other than INTERNAL_ERROR
+_ENDPOINT_ERROR_RESPONSES = {
+    'v1.get_medicine_info': MEDICINE_INFO_ERROR_RESPONSE,
+    'search_medicines': SEARCH_ERROR_RESPONSE,
+}
+
+@app.errorhandler(Exception)
+def handle_unexpected_error(e):
+    """Turn any exception a view didn't handle into a JSON 500"""
+    # 404s, 405s and other HTTP errors keep their own responses
+    if isinstance(e, HTTPException):
+        return e
+    logger.exception("Unhandled error in %s", request.endpoint)
+    return static_response(_ENDPOINT_ERROR_RESPONSES.get(request.endpoint, INTERNAL_ERROR_RESPONSE))
 
 if __name__ == '__main__':
     print("🚀 Starting TheraSwitchRx API Test Server...")
@@ -300,4 +410,35 @@ if __name__ == '__main__':
     print("🌐 Starting web server on http://localhost:5000")
     print("📖 API Documentation: http://localhost:5000/api/docs")
     print("🔑 Get API Key: http://localhost:5000/get-api-key")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+
+    # FLASK_DEBUG=1 keeps the Werkzeug dev server with the reloader and
+    # debugger; don't use it for performance tests
+    if os.environ.get('FLASK_DEBUG') == '1':
+        app.run(debug=True, host='0.0.0.0', port=5000)
+    else:
+        from gunicorn.app.base import BaseApplication
+
+        class StandaloneServer(BaseApplication):
+            """Serve app with gunicorn from this script"""
+
+            def __init__(self, application, options):
+                self.application = application
+                self.options = options
+                super().__init__()
+
+            def load_config(self):
+                for key, value in self.options.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return self.application
+
+        # Threaded workers by default: api_auth uses real threads and locks.
+        # TEST_API_WORKER_CLASS=gevent overlaps more I/O per worker
+        StandaloneServer(app, {
+            'bind': '0.0.0.0:5000',
+            'workers': int(os.environ.get('TEST_API_WORKERS', '4')),
+            'worker_class': os.environ.get('TEST_API_WORKER_CLASS', 'gthread'),
+            'threads': int(os.environ.get('TEST_API_THREADS', '8')),
+            'keepalive': 5
+        }).run()
\ No newline at end of file
@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import tempfile
+
+from api_auth import APIKeyManager
+
+# Stand-ins for gunicorn workers: one APIKeyManager each, sharing one database
+WORKERS = 2
+
+def test_daily_limit_across_workers():
+    """Several workers sharing one database must enforce the daily limit exactly"""
+    print("🧪 Testing daily limit across workers\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "api_keys.db")
+        workers = [APIKeyManager(db_path=db_path, redis_url="") for _ in range(WORKERS)]
+        key = workers[0].generate_api_key("test@example.com", "Test User")
+        limit = key["daily_limit"]
+
+        # Round-robin across workers, twice as many requests as the limit
+        results = [workers[i % WORKERS].validate_api_key(key["api_key"]) for i in range(2 * limit)]
+        accepted = [result for result in results if result["valid"]]
+        remaining = [result["requests_remaining"] for result in accepted]
+        print(f"   Accepted {len(accepted)} of {len(results)} requests (limit {limit})")
+
+        for worker in workers:
+            worker.flush()
+        with sqlite3.connect(db_path) as conn:
+            (requests_made,) = conn.execute("SELECT requests_made FROM api_keys").fetchone()
+        print(f"   requests_made in the database: {requests_made}")
+
+    assert len(accepted) == limit, f"accepted {len(accepted)} requests against a limit of {limit}"
+    assert requests_made == limit, f"recorded {requests_made} requests, expected {limit}"
+    # Each accepted request was counted exactly once
+    assert sorted(remaining, reverse=True) == list(range(limit - 1, -1, -1)), remaining
+    print("✅ Daily limit enforced across workers")
+
+if __name__ == "__main__":
+    test_daily_limit_across_workers()
@@ -1,5 +1,3 @@
-import sys
-
 class CustomException(Exception):
     """
     Custom exception class for the Med Recommender application.
@@ -17,14 +15,12 @@ class CustomException(Exception):
         self.error_message = error_message
         self.error_detail = error_detail
         
-        if error_detail:
-            _, _, exc_tb = sys.exc_info()
-            if exc_tb:
-                self.line_number = exc_tb.tb_lineno
-                self.file_name = exc_tb.tb_frame.f_code.co_filename
-            else:
-                self.line_number = None
-                self.file_name = None
+        # The original exception carries its own traceback, even when this
+        # is raised outside the except block that caught it
+        exc_tb = getattr(error_detail, '__traceback__', None)
+        if exc_tb is not None:
+            self.line_number = exc_tb.tb_lineno
+            self.file_name = exc_tb.tb_frame.f_code.co_filename
         else:
             self.line_number = None
             self.file_name = None
@@ -0,0 +1,34 @@
+import hashlib
+import json
+
+READ_SIZE = 1 << 20
+
+
+def file_sha256(path):
+    """Hex sha256 of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compute_fingerprint(source_path, schema_version):
+    return {
+        'sha256': file_sha256(source_path),
+        'schema_version': schema_version
+    }
+
+
+def read_fingerprint(path):
+    """Return the stored fingerprint, or None if it is missing or unreadable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_fingerprint(path, fingerprint):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(fingerprint, f, indent=2)
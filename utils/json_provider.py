@@ -0,0 +1,32 @@
+import orjson
+from flask import current_app
+from flask.json.provider import JSONProvider
+
+
+class ORJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson, so jsonify and request.get_json
+    use it; datetime and UUID values serialize natively
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
+
+def static_json(payload, status=200):
+    """Serialize a constant payload once, at import; pass the result to static_response"""
+    return orjson.dumps(payload), status
+
+
+def static_response(body_status):
+    """Fresh response around pre-serialized bytes (Response objects aren't safe to share)"""
+    body, status = body_status
+    return current_app.response_class(body, status=status, mimetype='application/json')
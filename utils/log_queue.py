@@ -0,0 +1,84 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """
+    StreamHandler that collects formatted records and writes them in one
+    call once buffer_size bytes are pending or flush_interval seconds have
+    passed. ERROR and above are written straight away.
+    """
+
+    def __init__(self, stream=None, buffer_size=16 * 1024, flush_interval=0.05):
+        super().__init__(stream)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._pending_size = 0
+        self._timer = None
+
+    def emit(self, record):
+        try:
+            text = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+        with self.lock:
+            self._pending.append(text)
+            self._pending_size += len(text)
+            flush_now = self._pending_size >= self.buffer_size or record.levelno >= logging.ERROR
+            if not flush_now and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending:
+                self.stream.write("".join(self._pending))
+                self._pending.clear()
+                self._pending_size = 0
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+
+
+def start_queue_logging(level=logging.INFO, buffer_size=16 * 1024, flush_interval=0.05):
+    """
+    Configure the root logger so that logging calls only enqueue records; a
+    listener thread formats them and writes them to stderr through a
+    BufferedStreamHandler. Returns the running QueueListener.
+    """
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue,
+        BufferedStreamHandler(buffer_size=buffer_size, flush_interval=flush_interval),
+        respect_handler_level=True
+    )
+    listener.handlers[0].setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    handler = logging.handlers.QueueHandler(log_queue)
+    # The listener's handler adds level and logger name; don't add them twice
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.basicConfig(level=level, handlers=[handler])
+    listener.start()
+    atexit.register(listener.stop)
+
+    def restart_listener():
+        """The listener and flush timer threads don't survive a fork; start fresh ones"""
+        # Records still buffered belong to the parent, which writes them
+        listener.handlers[0]._pending.clear()
+        listener.handlers[0]._pending_size = 0
+        listener.handlers[0]._timer = None
+        listener._thread = None
+        listener.start()
+
+    os.register_at_fork(after_in_child=restart_listener)
+    return listener
@@ -0,0 +1,21 @@
+import os
+import threading
+import uuid
+
+# Request ids come from a pooled urandom buffer: one syscall per 256 ids
+_RAND_BUF = bytearray()
+_RAND_LOCK = threading.Lock()
+_RAND_PID = None
+
+
+def fast_uuid4():
+    """Random (version 4) UUID drawn from the pooled buffer"""
+    global _RAND_PID
+    with _RAND_LOCK:
+        # A forked child must not hand out the same ids as its parent
+        if not _RAND_BUF or _RAND_PID != os.getpid():
+            _RAND_BUF[:] = os.urandom(16 * 256)
+            _RAND_PID = os.getpid()
+        raw = bytes(_RAND_BUF[-16:])
+        del _RAND_BUF[-16:]
+    return uuid.UUID(bytes=raw, version=4)
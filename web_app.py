@@ -1,17 +1,31 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, g, render_template, request, jsonify
+from werkzeug.exceptions import HTTPException
 from flask_cors import CORS
+from flask_compress import Compress
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from api_auth import require_api_key, api_manager
+from utils.json_provider import ORJSONProvider, static_json, static_response
+from utils.log_queue import start_queue_logging
+from utils.request_id import fast_uuid4
 from dotenv import load_dotenv
 import logging
+import orjson
+import re
+import threading
+import time
 from datetime import datetime
-import uuid
+from functools import wraps
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging. Request threads only enqueue records; a listener
+# thread writes them to stderr in batches of up to LOG_FLUSH_SIZE bytes,
+# at most LOG_FLUSH_MS milliseconds late (errors are written at once)
+LOG_FLUSH_SIZE = int(os.environ.get('LOG_FLUSH_SIZE', str(16 * 1024)))
+LOG_FLUSH_MS = int(os.environ.get('LOG_FLUSH_MS', '50'))
+
+_log_listener = start_queue_logging(buffer_size=LOG_FLUSH_SIZE, flush_interval=LOG_FLUSH_MS / 1000)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -19,14 +33,114 @@ load_dotenv()
 
 # Initialize Flask app
 app = Flask(__name__)
+# jsonify and request.get_json go through orjson: compact, unsorted output.
+# Timestamps and request ids are handed to it as datetime and UUID objects,
+# which it formats natively, the same way isoformat() and str() do
+app.json = ORJSONProvider(app)
 CORS(app)
-
-# Global pipeline instance
+# Recommendation JSON and the HTML pages compress several-fold; brotli
+# where the client accepts it. Streamed responses are sent as they are
+# (Compress(app) is called below add_cache_headers)
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_BR_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_STREAMS'] = False
+
+# Global pipeline instance; request handlers go through get_pipeline()
 pipeline = None
+_pipeline_lock = threading.Lock()
+_pipeline_last_attempt = None
+# The background load started by start_pipeline_init(), if any
+_pipeline_init_thread = None
+_pipeline_init_thread_lock = threading.Lock()
+# Seconds between attempts to initialize a pipeline that failed to load
+PIPELINE_RETRY_INTERVAL = float(os.getenv("PIPELINE_RETRY_INTERVAL", "30"))
 
-def get_fallback_response(query):
-    """Provide fallback response when pipeline is not available"""
-    return f"""
+# One '@', no whitespace, and a dot in the domain part
+_EMAIL_RE = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+_VALID_PLANS = frozenset(('free', 'basic', 'pro', 'enterprise'))
+
+# A caller's X-Request-Id is reused (and echoed) if it looks like an id
+_REQUEST_ID_RE = re.compile(r'[A-Za-z0-9._:-]{1,128}')
+
+# Longer search queries are cut to this many characters
+MAX_QUERY_LENGTH = 256
+
+def get_request_id():
+    """
+    The current request's id: the caller's X-Request-Id if it is sane,
+    otherwise a random UUID from the pooled generator. Fixed per request.
+    """
+    request_id = g.get('request_id')
+    if request_id is None:
+        incoming = request.headers.get('X-Request-Id')
+        request_id = incoming if incoming and _REQUEST_ID_RE.fullmatch(incoming) else fast_uuid4()
+        g.request_id = request_id
+    return request_id
+
+def _str_field(data, field, default=''):
+    """data[field] if the body is an object and the field a string, else ''"""
+    value = data.get(field, default) if isinstance(data, dict) else default
+    return value if isinstance(value, str) else ''
+
+def clean_query(raw):
+    """
+    The one form of a search query used for logging, the pipeline and the
+    response: whitespace runs collapsed, ends trimmed, capped in length.
+    Case is kept for the LLM; the pipeline's cache keys ignore it.
+    """
+    return " ".join(raw.split())[:MAX_QUERY_LENGTH]
+
+# 400s for search bodies, serialized once
+SEARCH_QUERY_REQUIRED_RESPONSE = static_json({
+    'success': False,
+    'error': 'Please provide a search query'
+}, 400)
+MISSING_QUERY_RESPONSE = static_json({
+    "success": False,
+    "error": "Query parameter is required",
+    "code": "MISSING_QUERY"
+}, 400)
+INVALID_QUERY_RESPONSE = static_json({
+    "success": False,
+    "error": "Query must be a string",
+    "code": "INVALID_QUERY"
+}, 400)
+EMPTY_QUERY_RESPONSE = static_json({
+    "success": False,
+    "error": "Query cannot be empty",
+    "code": "EMPTY_QUERY"
+}, 400)
+
+def with_query(missing, invalid, empty):
+    """
+    Read a {"query": ...} body and call the view with the cleaned query as
+    a keyword argument. A body without a query, a query that isn't a
+    string, or one that is blank gets the matching pre-serialized 400.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            data = request.get_json(silent=True, cache=False)
+            if not isinstance(data, dict) or 'query' not in data:
+                return static_response(missing)
+            if not isinstance(data['query'], str):
+                return static_response(invalid)
+            query = clean_query(data['query'])
+            if not query:
+                return static_response(empty)
+            return view(*args, query=query, **kwargs)
+        return decorated_function
+    return decorator
+
+# The legacy endpoints answer every bad query the same way
+with_search_query = with_query(
+    SEARCH_QUERY_REQUIRED_RESPONSE, SEARCH_QUERY_REQUIRED_RESPONSE, SEARCH_QUERY_REQUIRED_RESPONSE
+)
+with_v1_query = with_query(MISSING_QUERY_RESPONSE, INVALID_QUERY_RESPONSE, EMPTY_QUERY_RESPONSE)
+
+# Response text that only varies in the query and recommendation, built once
+FALLBACK_TEMPLATE = """
 **Alternative Medicines for "{query}":**
 
 ⚠️ **Note**: Our AI recommendation system is temporarily unavailable. Here are general guidelines:
@@ -48,12 +162,74 @@ def get_fallback_response(query):
 **System Status**: Pipeline temporarily unavailable - basic response provided.
 """
 
+# Constant parts wrapped around the query and recommendation by the legacy
+# /api/search endpoint; joined per request without re-parsing a template
+_LEGACY_ENHANCED_HEADER = "**AI-POWERED MEDICAL RECOMMENDATION**\n\n**Query Processed:** "
+_LEGACY_ENHANCED_MIDDLE = "\n\n**Database:** 4+ Lakh Medicines Analyzed\n\n"
+_LEGACY_ENHANCED_FOOTER = (
+    "\n\n---\n"
+    "*Powered by Advanced AI • Real-time Analysis • Comprehensive Database*"
+)
+
+# The same for /api/v1/search
+_ENHANCED_HEADER = "**TheraSwitchRx AI RECOMMENDATION**\n\n**Query:** "
+_ENHANCED_MIDDLE = (
+    "\n**Database:** 6+ Lakh Medicines Analyzed\n"
+    "**Analysis:** Real-time AI Processing\n\n"
+)
+_ENHANCED_FOOTER = (
+    "\n\n---\n"
+    "*Powered by Advanced AI • Comprehensive Medical Database • Instant Results*"
+)
+
+def get_fallback_response(query):
+    """Provide fallback response when pipeline is not available"""
+    return FALLBACK_TEMPLATE.format(query=query)
+
+def _pipeline_disabled():
+    # Allow disabling pipeline via env for minimal/lightweight images
+    return os.getenv("DISABLE_PIPELINE", "false").lower() in {"1", "true", "yes"}
+
+def get_pipeline():
+    """
+    The pipeline, or None while it is unavailable. If it isn't loaded, the
+    first request after PIPELINE_RETRY_INTERVAL seconds starts another load
+    in the background; no request waits on it, all get None (the fallback)
+    until it is up.
+    """
+    if pipeline is not None or _pipeline_disabled():
+        return pipeline
+    if _pipeline_last_attempt is not None and time.monotonic() - _pipeline_last_attempt < PIPELINE_RETRY_INTERVAL:
+        return None
+    start_pipeline_init()
+    return None
+
 def init_pipeline():
     """Initialize the medical recommendation pipeline with better error handling"""
-    global pipeline
+    with _pipeline_lock:
+        # Checked under the lock: another load may have just finished
+        if pipeline is not None:
+            return True
+        return _init_pipeline_locked()
+
+def start_pipeline_init():
+    """
+    Load the pipeline on a background thread so the server can start
+    answering (health checks, fallback responses) while it loads. Returns
+    the load already running, if there is one, instead of starting another.
+    """
+    global _pipeline_init_thread
+    with _pipeline_init_thread_lock:
+        if _pipeline_init_thread is None or not _pipeline_init_thread.is_alive():
+            _pipeline_init_thread = threading.Thread(target=init_pipeline, name="pipeline-init", daemon=True)
+            _pipeline_init_thread.start()
+        return _pipeline_init_thread
+
+def _init_pipeline_locked():
+    global pipeline, _pipeline_last_attempt
+    _pipeline_last_attempt = time.monotonic()
     try:
-        # Allow disabling pipeline via env for minimal/lightweight images
-        if os.getenv("DISABLE_PIPELINE", "false").lower() in {"1", "true", "yes"}:
+        if _pipeline_disabled():
             logger.warning("Pipeline initialization skipped due to DISABLE_PIPELINE env var")
             pipeline = None
             return False
@@ -61,11 +237,14 @@ def init_pipeline():
         # Lazy import to avoid crashing when optional heavy deps are missing
         from pipeline.pipeline import MedRecommendationPipeline  # noqa: WPS433
         logger.info("Initializing Medical Recommendation Pipeline...")
-        pipeline = MedRecommendationPipeline()
+        new_pipeline = MedRecommendationPipeline()
+        new_pipeline.warm_up()
+        # Published once warm; requests meanwhile get the fallback
+        pipeline = new_pipeline
         logger.info("✅ Pipeline initialized successfully!")
         return True
     except Exception as e:
-        logger.error(f"❌ Failed to initialize pipeline: {str(e)}")
+        logger.error("❌ Failed to initialize pipeline: %s", e)
         logger.warning("⚠️ Starting Flask app without ML pipeline - API will use fallback responses")
         logger.info("🔄 App will continue running with fallback mode")
         pipeline = None
@@ -87,195 +266,256 @@ def api_documentation():
     return render_template('api_docs.html')
 
 @app.route('/api/search', methods=['POST'])
-def search_medicines():
+@with_search_query
+def search_medicines(query):
     """API endpoint for medicine search"""
-    global pipeline
-    try:
-        data = request.get_json()
-        query = data.get('query', '').strip()
-        
-        if not query:
-            return jsonify({
-                'success': False,
-                'error': 'Please provide a search query'
-            }), 400
-
-        # Get recommendations from pipeline or fallback
-        logger.info(f"Processing query: {query}")
-        
-        if pipeline is None:
-            logger.warning("Using fallback response - pipeline not available")
+    pipeline = get_pipeline()
+    # Get recommendations from pipeline or fallback
+    logger.info("Processing query: %s", query)
+    
+    if pipeline is None:
+        logger.warning("Using fallback response - pipeline not available")
+        recommendation = get_fallback_response(query)
+        is_fallback = True
+    else:
+        try:
+            recommendation = pipeline.recommend(query)
+            is_fallback = False
+        except Exception as e:
+            logger.error("Pipeline error, using fallback: %s", e)
             recommendation = get_fallback_response(query)
             is_fallback = True
-        else:
-            try:
-                recommendation = pipeline.recommend(query)
-                is_fallback = False
-            except Exception as e:
-                logger.error(f"Pipeline error, using fallback: {e}")
-                recommendation = get_fallback_response(query)
-                is_fallback = True
-        
-        # Enhance the response with additional metadata
-        enhanced_recommendation = f"""
-**AI-POWERED MEDICAL RECOMMENDATION**
+    
+    # Enhance the response with additional metadata
+    enhanced_recommendation = "".join([
+        _LEGACY_ENHANCED_HEADER, query, _LEGACY_ENHANCED_MIDDLE, recommendation, _LEGACY_ENHANCED_FOOTER
+    ])
+    
+    return jsonify({
+        'success': True,
+        'query': query,
+        'recommendation': enhanced_recommendation,
+        'metadata': {
+            'database_size': '4+ Lakh medicines',
+            'processing_type': 'AI-powered analysis',
+            'response_time': 'Real-time'
+        }
+    })
 
-**Query Processed:** {query}
+# Longer pieces (cached answers, the fallback text) are split into delta
+# lines of at most this many characters
+STREAM_CHUNK_SIZE = 200
 
-**Database:** 4+ Lakh Medicines Analyzed
+def _ndjson(payload):
+    return orjson.dumps(payload) + b"\n"
 
-{recommendation}
+def _delta_lines(text):
+    for start in range(0, len(text), STREAM_CHUNK_SIZE):
+        yield _ndjson({"type": "delta", "t": text[start:start + STREAM_CHUNK_SIZE]})
 
----
-*Powered by Advanced AI • Real-time Analysis • Comprehensive Database*
-        """.strip()
-        
-        return jsonify({
-            'success': True,
-            'query': query,
-            'recommendation': enhanced_recommendation,
-            'metadata': {
-                'database_size': '4+ Lakh medicines',
-                'processing_type': 'AI-powered analysis',
-                'response_time': 'Real-time'
-            }
-        })
+def _iter_recommendation(pipeline, query):
+    """
+    (piece, is_fallback) pairs of the recommendation for query, as the LLM
+    produces them. Falls back to the canned text if the pipeline is down or
+    fails before its first piece; a failure after that is raised.
+    """
+    if pipeline is None:
+        logger.warning("Using fallback response - pipeline not available")
+        yield get_fallback_response(query), True
+        return
 
+    started = False
+    try:
+        for piece in pipeline.recommend_stream(query):
+            started = True
+            yield piece, False
     except Exception as e:
-        logger.error(f"Error processing search request: {e}")
-        return jsonify({
-            'success': False,
-            'error': 'An error occurred while processing your request'
-        }), 500
+        if started:
+            raise
+        logger.error("Pipeline error, using fallback: %s", e)
+        yield get_fallback_response(query), True
+
+@app.route('/api/search/stream', methods=['POST'])
+@with_search_query
+def search_medicines_stream(query):
+    """
+    Streaming variant of /api/search
+    Response: newline-delimited JSON, one "meta" line, then "delta" lines
+    that concatenate to the same recommendation /api/search returns, then
+    a "done" line (or an "error" line if the stream breaks off)
+    """
+    logger.info("Processing stream query: %s", query)
+    # Resolve the pipeline now; the generator runs after the request context is gone
+    pipeline = get_pipeline()
+
+    def generate():
+        yield _ndjson({"type": "meta", "query": query})
+        # The header does not depend on the pipeline, so it ships before
+        # the recommendation is generated
+        yield _ndjson({"type": "delta", "t": _LEGACY_ENHANCED_HEADER + query + _LEGACY_ENHANCED_MIDDLE})
+        is_fallback = False
+        try:
+            for piece, is_fallback in _iter_recommendation(pipeline, query):
+                yield from _delta_lines(piece)
+        except Exception as e:
+            # Headers are already sent; report the failure in-band
+            logger.error("Stream error: %s", e)
+            yield _ndjson({"type": "error", "error": "An error occurred while processing your request"})
+            return
+        yield _ndjson({"type": "delta", "t": _LEGACY_ENHANCED_FOOTER})
+        yield _ndjson({"type": "done", "is_fallback": is_fallback})
+
+    return app.response_class(generate(), mimetype='application/x-ndjson', direct_passthrough=True)
 
 # ========== API v1 ENDPOINTS (WITH AUTHENTICATION) ==========
 
+# /api/v1/search metadata per (is_fallback, pipeline available); only the
+# timestamp and request id change per request. Key order is the response's
+_SEARCH_METADATA = {
+    (is_fallback, pipeline_available): {
+        "timestamp": None,
+        "request_id": None,
+        "database_size": "6+ Lakh medicines",
+        "processing_type": "AI-powered analysis" if not is_fallback else "Fallback response",
+        "response_time": "< 2 seconds",
+        "is_fallback": is_fallback,
+        "pipeline_status": "active" if pipeline_available else "maintenance"
+    }
+    for is_fallback in (False, True)
+    for pipeline_available in (False, True)
+}
+
+def _search_metadata(is_fallback, pipeline_available):
+    metadata = _SEARCH_METADATA[is_fallback, pipeline_available].copy()
+    metadata["timestamp"] = datetime.now()
+    metadata["request_id"] = get_request_id()
+    return metadata
+
 @app.route('/api/v1/search', methods=['POST'])
 @require_api_key
-def api_v1_search():
+@with_v1_query
+def api_v1_search(query):
     """
     Enhanced API endpoint for medicine search (requires API key)
     Headers: X-API-Key: your_api_key_here
     Body: {"query": "medicine name or condition"}
     """
-    global pipeline
-    try:
-        data = request.get_json()
-        
-        if not data or 'query' not in data:
-            return jsonify({
-                "success": False,
-                "error": "Query parameter is required",
-                "code": "MISSING_QUERY"
-            }), 400
-        
-        query = data['query'].strip()
-        if not query:
-            return jsonify({
-                "success": False,
-                "error": "Query cannot be empty",
-                "code": "EMPTY_QUERY"
-            }), 400
-
-        # Get recommendations from pipeline or fallback
-        logger.info(f"API v1 request from {request.api_user['user_email']}: {query}")
-        
-        if pipeline is None:
-            logger.warning("Using fallback response - pipeline not available")
+    pipeline = get_pipeline()
+    # Get recommendations from pipeline or fallback
+    logger.info("API v1 request from %s: %s", request.api_user['user_email'], query)
+    
+    if pipeline is None:
+        logger.warning("Using fallback response - pipeline not available")
+        recommendation = get_fallback_response(query)
+        is_fallback = True
+    else:
+        try:
+            recommendation = pipeline.recommend(query)
+            is_fallback = False
+        except Exception as e:
+            logger.error("Pipeline error, using fallback: %s", e)
             recommendation = get_fallback_response(query)
             is_fallback = True
-        else:
-            try:
-                recommendation = pipeline.recommend(query)
-                is_fallback = False
-            except Exception as e:
-                logger.error(f"Pipeline error, using fallback: {e}")
-                recommendation = get_fallback_response(query)
-                is_fallback = True
-        
-        # Enhanced response
-        enhanced_recommendation = f"""
-**TheraSwitchRx AI RECOMMENDATION**
-
-**Query:** {query}
-**Database:** 6+ Lakh Medicines Analyzed
-**Analysis:** Real-time AI Processing
-
-{recommendation}
+    
+    # Enhanced response
+    enhanced_recommendation = "".join([
+        _ENHANCED_HEADER, query, _ENHANCED_MIDDLE, recommendation, _ENHANCED_FOOTER
+    ])
+    
+    return jsonify({
+        "success": True,
+        "data": {
+            "query": query,
+            "recommendation": enhanced_recommendation,
+            "metadata": _search_metadata(is_fallback, pipeline is not None)
+        },
+        "message": "Recommendations generated successfully",
+        "api_usage": {
+            "requests_remaining": request.api_user["requests_remaining"],
+            "plan": request.api_user["plan"],
+            "user": request.api_user["user_email"]
+        }
+    })
 
----
-*Powered by Advanced AI • Comprehensive Medical Database • Instant Results*
-        """.strip()
-        
-        return jsonify({
-            "success": True,
-            "data": {
-                "query": query,
-                "recommendation": enhanced_recommendation,
-                "metadata": {
-                    "timestamp": datetime.now().isoformat(),
-                    "request_id": str(uuid.uuid4()),
-                    "database_size": "6+ Lakh medicines",
-                    "processing_type": "AI-powered analysis" if not is_fallback else "Fallback response",
-                    "response_time": "< 2 seconds",
-                    "is_fallback": is_fallback,
-                    "pipeline_status": "active" if pipeline is not None else "maintenance"
-                }
-            },
-            "message": "Recommendations generated successfully",
-            "api_usage": {
-                "requests_remaining": request.api_user["requests_remaining"],
-                "plan": request.api_user["plan"],
-                "user": request.api_user["user_email"]
-            }
+@app.route('/api/v1/search/stream', methods=['POST'])
+@require_api_key
+@with_v1_query
+def api_v1_search_stream(query):
+    """
+    Streaming variant of /api/v1/search (requires API key)
+    Headers: X-API-Key: your_api_key_here
+    Body: {"query": "medicine name or condition"}
+    Response: newline-delimited JSON, one "meta" line, then "delta" lines
+    that concatenate to the recommendation /api/v1/search returns, then a
+    "done" line with the usage (or an "error" line if the stream breaks off)
+    """
+    api_user = request.api_user
+    logger.info("API v1 stream request from %s: %s", api_user['user_email'], query)
+    # Build everything the generator needs now; it runs after the request context is gone
+    pipeline = get_pipeline()
+    api_usage = {
+        "requests_remaining": api_user["requests_remaining"],
+        "plan": api_user["plan"],
+        "user": api_user["user_email"]
+    }
+    request_id = get_request_id()
+
+    def generate():
+        yield _ndjson({
+            "type": "meta",
+            "query": query,
+            "timestamp": datetime.now(),
+            "request_id": request_id
         })
-        
-    except Exception as e:
-        logger.error(f"API v1 search error: {str(e)}")
-        return jsonify({
-            "success": False,
-            "error": "Internal server error",
-            "code": "INTERNAL_ERROR"
-        }), 500
+        yield _ndjson({"type": "delta", "t": _ENHANCED_HEADER + query + _ENHANCED_MIDDLE})
+        is_fallback = False
+        try:
+            for piece, is_fallback in _iter_recommendation(pipeline, query):
+                yield from _delta_lines(piece)
+        except Exception as e:
+            # Headers are already sent; report the failure in-band
+            logger.error("API v1 stream error: %s", e)
+            yield _ndjson({"type": "error", "code": "INTERNAL_ERROR"})
+            return
+        yield _ndjson({"type": "delta", "t": _ENHANCED_FOOTER})
+        yield _ndjson({
+            "type": "done",
+            "is_fallback": is_fallback,
+            "pipeline_status": "active" if pipeline is not None else "maintenance",
+            "api_usage": api_usage
+        })
+
+    return app.response_class(generate(), mimetype='application/x-ndjson', direct_passthrough=True)
 
 @app.route('/api/v1/medicine/<medicine_name>', methods=['GET'])
 @require_api_key
 def get_medicine_info(medicine_name):
     """Get detailed information about a specific medicine"""
-    global pipeline
-    try:
-        if pipeline is None:
-            return jsonify({
-                "success": False,
-                "error": "Medical recommendation system is not initialized",
-                "code": "PIPELINE_ERROR"
-            }), 500
-        
-        # Use your existing pipeline to get medicine info
-        query = f"detailed information about {medicine_name}"
-        medicine_info = pipeline.recommend(query)
-        
-        return jsonify({
-            "success": True,
-            "data": {
-                "medicine_name": medicine_name,
-                "information": medicine_info,
-                "timestamp": datetime.now().isoformat()
-            },
-            "message": f"Information for {medicine_name} retrieved successfully",
-            "api_usage": {
-                "requests_remaining": request.api_user["requests_remaining"],
-                "plan": request.api_user["plan"]
-            }
-        })
-        
-    except Exception as e:
-        logger.error(f"Medicine info error: {str(e)}")
+    pipeline = get_pipeline()
+    if pipeline is None:
         return jsonify({
             "success": False,
-            "error": "Failed to retrieve medicine information",
-            "code": "MEDICINE_INFO_ERROR"
+            "error": "Medical recommendation system is not initialized",
+            "code": "PIPELINE_ERROR"
         }), 500
+    
+    # Use your existing pipeline to get medicine info
+    query = f"detailed information about {medicine_name}"
+    medicine_info = pipeline.recommend(query)
+    
+    return jsonify({
+        "success": True,
+        "data": {
+            "medicine_name": medicine_name,
+            "information": medicine_info,
+            "timestamp": datetime.now()
+        },
+        "message": f"Information for {medicine_name} retrieved successfully",
+        "api_usage": {
+            "requests_remaining": request.api_user["requests_remaining"],
+            "plan": request.api_user["plan"]
+        }
+    })
 
 @app.route('/api/v1/alternatives', methods=['POST'])
 @require_api_key
@@ -284,76 +524,70 @@ def get_bulk_alternatives():
     Get alternatives for multiple medicines
     Body: {"medicines": ["med1", "med2", "med3"]}
     """
-    global pipeline
-    try:
-        data = request.get_json()
-        
-        if not data or 'medicines' not in data:
-            return jsonify({
-                "success": False,
-                "error": "Medicines list is required",
-                "code": "MISSING_MEDICINES"
-            }), 400
-        
-        medicines = data['medicines']
-        
-        if not isinstance(medicines, list) or not medicines:
-            return jsonify({
-                "success": False,
-                "error": "Medicines must be a non-empty list",
-                "code": "INVALID_MEDICINES_FORMAT"
-            }), 400
-        
-        if len(medicines) > 10:  # Limit bulk requests
-            return jsonify({
-                "success": False,
-                "error": "Maximum 10 medicines allowed per request",
-                "code": "TOO_MANY_MEDICINES"
-            }), 400
-        
-        if pipeline is None:
-            return jsonify({
-                "success": False,
-                "error": "Medical recommendation system is not initialized",
-                "code": "PIPELINE_ERROR"
-            }), 500
-        
-        results = {}
-        for medicine in medicines:
-            try:
-                query = f"alternatives for {medicine}"
-                alternatives = pipeline.recommend(query)
-                results[medicine] = {
-                    "alternatives": alternatives,
-                    "status": "success"
-                }
-            except Exception as e:
-                results[medicine] = {
-                    "error": str(e),
-                    "status": "failed"
-                }
-        
+    pipeline = get_pipeline()
+    data = request.get_json(silent=True, cache=False)
+    
+    if not isinstance(data, dict) or 'medicines' not in data:
         return jsonify({
-            "success": True,
-            "data": {
-                "results": results,
-                "processed_count": len(medicines),
-                "timestamp": datetime.now().isoformat()
-            },
-            "message": f"Alternatives processed for {len(medicines)} medicines",
-            "api_usage": {
-                "requests_remaining": request.api_user["requests_remaining"],
-                "plan": request.api_user["plan"]
-            }
-        })
-        
-    except Exception as e:
-        logger.error(f"Bulk alternatives error: {str(e)}")
+            "success": False,
+            "error": "Medicines list is required",
+            "code": "MISSING_MEDICINES"
+        }), 400
+    
+    medicines = data['medicines']
+    
+    if (not isinstance(medicines, list) or not medicines
+            or not all(isinstance(medicine, str) for medicine in medicines)):
         return jsonify({
             "success": False,
-            "error": "Failed to process bulk alternatives request",
-            "code": "BULK_ALTERNATIVES_ERROR"
+            "error": "Medicines must be a non-empty list of names",
+            "code": "INVALID_MEDICINES_FORMAT"
+        }), 400
+    
+    if len(medicines) > 10:  # Limit bulk requests
+        return jsonify({
+            "success": False,
+            "error": "Maximum 10 medicines allowed per request",
+            "code": "TOO_MANY_MEDICINES"
+        }), 400
+    
+    if pipeline is None:
+        return jsonify({
+            "success": False,
+            "error": "Medical recommendation system is not initialized",
+            "code": "PIPELINE_ERROR"
         }), 500
+    
+    # Results are keyed by name, so a repeated name is only looked up once.
+    # The rest go to the LLM as one batch instead of one after another
+    unique_medicines = list(dict.fromkeys(medicines))
+    queries = [f"alternatives for {medicine}" for medicine in unique_medicines]
+    results = {}
+    for medicine, alternatives in zip(unique_medicines, pipeline.recommend_many(queries)):
+        if isinstance(alternatives, Exception):
+            results[medicine] = {
+                "error": str(alternatives),
+                "status": "failed"
+            }
+        else:
+            results[medicine] = {
+                "alternatives": alternatives,
+                "status": "success"
+            }
+    
+    return jsonify({
+        "success": True,
+        "data": {
+            "results": results,
+            "processed_count": len(medicines),
+            "timestamp": datetime.now()
+        },
+        "message": f"Alternatives processed for {len(medicines)} medicines",
+        "api_usage": {
+            "requests_remaining": request.api_user["requests_remaining"],
+            "plan": request.api_user["plan"]
+        }
+    })
 
 # ========== API KEY MANAGEMENT ENDPOINTS ==========
 
@@ -363,68 +597,59 @@ def create_api_key():
     Generate a new API key
     Body: {"email": "user@example.com", "name": "User Name", "plan": "free"}
     """
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "success": False,
-                "error": "Request body is required",
-                "code": "MISSING_DATA"
-            }), 400
-        
-        email = data.get('email', '').strip()
-        name = data.get('name', '').strip()
-        plan = data.get('plan', 'free').strip()
-        
-        if not email or not name:
-            return jsonify({
-                "success": False,
-                "error": "Email and name are required",
-                "code": "MISSING_CREDENTIALS"
-            }), 400
-        
-        # Basic email validation
-        if '@' not in email or '.' not in email:
-            return jsonify({
-                "success": False,
-                "error": "Invalid email format",
-                "code": "INVALID_EMAIL"
-            }), 400
-        
-        # Validate plan
-        if plan not in ['free', 'basic', 'pro', 'enterprise']:
-            return jsonify({
-                "success": False,
-                "error": "Invalid plan type. Choose from: free, basic, pro, enterprise",
-                "code": "INVALID_PLAN"
-            }), 400
-        
-        # Generate API key
-        result = api_manager.generate_api_key(email, name, plan)
-        
-        if not result:
-            return jsonify({
-                "success": False,
-                "error": "Failed to generate API key. Email might already be registered.",
-                "code": "GENERATION_FAILED"
-            }), 400
-        
-        logger.info(f"New API key generated for {email} ({plan} plan)")
-        
+    data = request.get_json(silent=True, cache=False)
+    
+    if not data:
         return jsonify({
-            "success": True,
-            "data": result,
-            "message": "API key generated successfully"
-        })
-        
-    except Exception as e:
-        logger.error(f"API key generation error: {str(e)}")
+            "success": False,
+            "error": "Request body is required",
+            "code": "MISSING_DATA"
+        }), 400
+    
+    email = _str_field(data, 'email').strip()
+    name = _str_field(data, 'name').strip()
+    plan = _str_field(data, 'plan', 'free').strip()
+    
+    if not email or not name:
         return jsonify({
             "success": False,
-            "error": "Internal server error",
-            "code": "INTERNAL_ERROR"
-        }), 500
+            "error": "Email and name are required",
+            "code": "MISSING_CREDENTIALS"
+        }), 400
+    
+    # Basic email validation
+    if not _EMAIL_RE.fullmatch(email):
+        return jsonify({
+            "success": False,
+            "error": "Invalid email format",
+            "code": "INVALID_EMAIL"
+        }), 400
+    
+    # Validate plan
+    if plan not in _VALID_PLANS:
+        return jsonify({
+            "success": False,
+            "error": "Invalid plan type. Choose from: free, basic, pro, enterprise",
+            "code": "INVALID_PLAN"
+        }), 400
+    
+    # Generate API key
+    result = api_manager.generate_api_key(email, name, plan)
+    
+    if not result:
+        return jsonify({
+            "success": False,
+            "error": "Failed to generate API key. Email might already be registered.",
+            "code": "GENERATION_FAILED"
+        }), 400
+    
+    logger.info("New API key generated for %s (%s plan)", email, plan)
+    
+    return jsonify({
+        "success": True,
+        "data": result,
+        "message": "API key generated successfully"
+    })
 
 @app.route('/api/v1/key-info', methods=['GET'])
 @require_api_key
@@ -443,15 +668,13 @@ def get_api_key_info():
 
 # ========== PUBLIC ENDPOINTS (NO AUTHENTICATION) ==========
 
-@app.route('/api/v1/health', methods=['GET'])
-def api_v1_health():
-    """API Health check (public endpoint)"""
-    return jsonify({
+def _health_payload(pipeline_initialized):
+    return {
         "success": True,
         "data": {
             "status": "healthy",
             "version": "1.0.0",
-            "pipeline_initialized": pipeline is not None,
+            "pipeline_initialized": pipeline_initialized,
             "total_medicines": "6+ lakh",
             "uptime": "Active",
             "features": [
@@ -462,53 +685,136 @@ def api_v1_health():
             ]
         },
         "message": "TheraSwitchRx API is running"
-    })
+    }
+
+# Health and stats bodies only depend on whether the pipeline is up, so
+# every variant is serialized once here, keyed by pipeline_initialized
+HEALTH_RESPONSES = {
+    initialized: static_json(_health_payload(initialized)) for initialized in (True, False)
+}
+
+STATS_RESPONSE = static_json({
+    "success": True,
+    "data": {
+        "total_medicines": "6+ lakh",
+        "api_version": "1.0.0",
+        "features": {
+            "medicine_search": "Advanced AI search",
+            "alternatives": "Smart alternatives",
+            "bulk_processing": "Multiple medicines",
+            "real_time": "< 2 second response"
+        },
+        "plans": {
+            "free": "100 requests/day",
+            "basic": "1,000 requests/day", 
+            "pro": "10,000 requests/day",
+            "enterprise": "Unlimited"
+        }
+    },
+    "message": "API statistics retrieved successfully"
+})
+
+LEGACY_HEALTH_RESPONSES = {
+    initialized: static_json({
+        'status': 'healthy',
+        'pipeline_initialized': initialized
+    }) for initialized in (True, False)
+}
+
+@app.route('/api/v1/health', methods=['GET'])
+def api_v1_health():
+    """API Health check (public endpoint)"""
+    return static_response(HEALTH_RESPONSES[pipeline is not None])
 
 @app.route('/api/v1/stats', methods=['GET'])
 def api_v1_stats():
     """Get API statistics (public endpoint)"""
-    return jsonify({
-        "success": True,
-        "data": {
-            "total_medicines": "6+ lakh",
-            "api_version": "1.0.0",
-            "features": {
-                "medicine_search": "Advanced AI search",
-                "alternatives": "Smart alternatives",
-                "bulk_processing": "Multiple medicines",
-                "real_time": "< 2 second response"
-            },
-            "plans": {
-                "free": "100 requests/day",
-                "basic": "1,000 requests/day", 
-                "pro": "10,000 requests/day",
-                "enterprise": "Unlimited"
-            }
-        },
-        "message": "API statistics retrieved successfully"
-    })
+    return static_response(STATS_RESPONSE)
 
 # ========== LEGACY ENDPOINTS (BACKWARD COMPATIBILITY) ==========
 
 @app.route('/api/health')
 def health_check():
     """Legacy health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'pipeline_initialized': pipeline is not None
-    })
+    return static_response(LEGACY_HEALTH_RESPONSES[pipeline is not None])
+
+# Cache-Control for GET endpoints whose response only changes on deploy (or,
+# for health, when the pipeline comes up), keyed by Flask endpoint name.
+# Health stays short-lived so outages show up quickly
+CACHE_CONTROL = {
+    'index': 'public, max-age=3600',
+    'get_api_key_page': 'public, max-age=3600',
+    'api_documentation': 'public, max-age=3600',
+    'api_v1_stats': 'public, max-age=3600',
+    'api_v1_health': 'public, max-age=5',
+    'health_check': 'public, max-age=5',
+}
+
+@app.after_request
+def add_cache_headers(response):
+    """Let browsers and CDNs cache the endpoints in CACHE_CONTROL, revalidating by ETag"""
+    cache_control = CACHE_CONTROL.get(request.endpoint)
+    if cache_control is not None and response.status_code == 200:
+        response.headers['Cache-Control'] = cache_control
+        response.add_etag()
+        # Answers a matching If-None-Match with an empty 304
+        response.make_conditional(request)
+    return response
+
+@app.after_request
+def add_request_id_header(response):
+    """Return the request id to callers that sent one or got one in the body"""
+    if 'request_id' in g or 'X-Request-Id' in request.headers:
+        response.headers['X-Request-Id'] = str(get_request_id())
+    return response
+
+# Registered after add_cache_headers so it runs first (after_request hooks
+# run in reverse): ETags are then taken over the bytes actually sent
+Compress(app)
+
+# ========== ERROR HANDLING ==========
+
+INTERNAL_ERROR_RESPONSE = static_json({
+    "success": False,
+    "error": "Internal server error",
+    "code": "INTERNAL_ERROR"
+}, 500)
+
+# Endpoints whose unexpected errors get a body other than INTERNAL_ERROR
+_ENDPOINT_ERROR_RESPONSES = {
+    'search_medicines': static_json({
+        'success': False,
+        'error': 'An error occurred while processing your request'
+    }, 500),
+    'get_medicine_info': static_json({
+        "success": False,
+        "error": "Failed to retrieve medicine information",
+        "code": "MEDICINE_INFO_ERROR"
+    }, 500),
+    'get_bulk_alternatives': static_json({
+        "success": False,
+        "error": "Failed to process bulk alternatives request",
+        "code": "BULK_ALTERNATIVES_ERROR"
+    }, 500),
+}
+
+@app.errorhandler(Exception)
+def handle_unexpected_error(e):
+    """Turn any exception a view didn't handle into a JSON 500"""
+    # 404s, 405s and other HTTP errors keep their own responses
+    if isinstance(e, HTTPException):
+        return e
+    logger.exception("Unhandled error in %s", request.endpoint)
+    return static_response(_ENDPOINT_ERROR_RESPONSES.get(request.endpoint, INTERNAL_ERROR_RESPONSE))
 
 if __name__ == '__main__':
     try:
         print("🚀 Starting TheraSwitchRx | by MedQ AI...")
         
-        # Initialize the pipeline (but don't exit if it fails)
-        pipeline_success = init_pipeline()
-        
-        if pipeline_success:
-            print("✅ AI Pipeline: ACTIVE")
-        else:
-            print("⚠️ AI Pipeline: FALLBACK MODE")
+        # Load the pipeline in the background; until it is up (or if it
+        # fails) searches get fallback responses
+        start_pipeline_init()
+        print("⏳ AI Pipeline: LOADING (fallback responses until it is ready)")
         
         print("🌐 Starting web server...")
         print("📡 Server will be available at: http://0.0.0.0:5000")